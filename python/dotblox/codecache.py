@@ -0,0 +1,194 @@
+import hashlib
+import marshal
+import os
+import tempfile
+import threading
+import traceback
+
+from dotblox import config
+
+try:
+    from importlib.util import MAGIC_NUMBER
+except ImportError:
+    import imp
+    MAGIC_NUMBER = imp.get_magic()
+
+# Folder in the global settings folder holding the compiled scripts
+CACHE_FOLDER = "codecache"
+
+# file path: (key, code)
+__CODE = {}
+__CODE_LOCK = threading.Lock()
+
+
+def _get_key(file_path):
+    """Get what identifies this version of the file
+
+    Returns:
+        tuple: path, mtime in nanoseconds, size and interpreter magic
+    """
+    stat = os.stat(file_path)
+    mtime_ns = getattr(stat, "st_mtime_ns", None)
+    if mtime_ns is None:
+        mtime_ns = int(stat.st_mtime * 1e9)
+    return file_path, mtime_ns, stat.st_size, MAGIC_NUMBER
+
+
+def get_cache_folder():
+    return os.path.join(config.get_global_settings_folder(), CACHE_FOLDER)
+
+
+def get_cache_file(file_path):
+    """Get the file the compiled script is saved to
+
+    Scripts often live on read only shares so they are not saved next
+    to the script like __pycache__.
+
+    Args:
+        file_path (str): script path
+
+    Returns:
+        str
+    """
+    name = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()
+    return os.path.join(get_cache_folder(), name + ".bin")
+
+
+def _read(cache_file, key, load_code=True):
+    """Load the code saved for the key
+
+    The file holds the interpreter magic, the marshalled path, mtime
+    and size then the marshalled code.
+
+    Args:
+        cache_file (str): file written by _write
+        key (tuple): see _get_key
+        load_code (bool): only check the file is current
+
+    Returns:
+        code|bool|None: None when missing, stale or unreadable, True
+                        when current and the code is not loaded
+    """
+    try:
+        with open(cache_file, "rb") as f:
+            if f.read(len(MAGIC_NUMBER)) != MAGIC_NUMBER:
+                return None
+            path, mtime_ns, size = marshal.load(f)
+            if (path, mtime_ns, size, MAGIC_NUMBER) != key:
+                return None
+            if not load_code:
+                return True
+            return marshal.load(f)
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        return None
+
+
+def _write(cache_file, key, code):
+    """Save the code atomically, failing silently when it can't"""
+    path, mtime_ns, size, _ = key
+    data = MAGIC_NUMBER + marshal.dumps((path, mtime_ns, size)) + marshal.dumps(code)
+    try:
+        folder = os.path.dirname(cache_file)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        fd, temp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            if hasattr(os, "replace"):
+                os.replace(temp_path, cache_file)
+            else:
+                if os.path.exists(cache_file):
+                    os.remove(cache_file)
+                os.rename(temp_path, cache_file)
+        except Exception:
+            os.remove(temp_path)
+            raise
+    except (IOError, OSError):
+        pass
+
+
+def get_code(file_path):
+    """Get the compiled code of the script
+
+    The code is kept in memory and saved to the global settings folder
+    keyed by the path, modified time, size and interpreter, so the
+    script is only compiled again after it changed.
+
+    Args:
+        file_path (str): script path
+
+    Raises:
+        SyntaxError: when the script does not compile
+
+    Returns:
+        code
+
+    Usage:
+        exec(codecache.get_code(file_path))
+
+    """
+    file_path = os.path.abspath(file_path)
+    key = _get_key(file_path)
+    with __CODE_LOCK:
+        cached = __CODE.get(file_path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    cache_file = get_cache_file(file_path)
+    code = _read(cache_file, key)
+    if code is None:
+        with open(file_path, "rb") as f:
+            source = f.read()
+        code = compile(source, file_path, "exec")
+        _write(cache_file, key, code)
+
+    with __CODE_LOCK:
+        __CODE[file_path] = (key, code)
+    return code
+
+
+def compile_file(file_path):
+    """Compile the script to the cache unless it is already there
+
+    Unlike get_code the code is not kept in memory, used to warm the
+    cache ahead of the first run.
+
+    Args:
+        file_path (str): script path
+
+    Returns:
+        str|None: the error when the script does not compile
+    """
+    file_path = os.path.abspath(file_path)
+    try:
+        key = _get_key(file_path)
+    except OSError:
+        return None
+    cache_file = get_cache_file(file_path)
+    if _read(cache_file, key, load_code=False):
+        return None
+    try:
+        with open(file_path, "rb") as f:
+            source = f.read()
+        code = compile(source, file_path, "exec")
+    except (IOError, OSError):
+        return None
+    except (SyntaxError, ValueError, TypeError) as e:
+        return "".join(traceback.format_exception_only(type(e), e)).strip()
+    _write(cache_file, key, code)
+    return None
+
+
+def clear():
+    """Forget every compiled script, in memory and on disk"""
+    with __CODE_LOCK:
+        __CODE.clear()
+    folder = get_cache_folder()
+    if not os.path.isdir(folder):
+        return
+    for name in os.listdir(folder):
+        try:
+            os.remove(os.path.join(folder, name))
+        except OSError:
+            pass
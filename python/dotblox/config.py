@@ -1,11 +1,46 @@
+import atexit
+import collections
+import contextlib
 import copy
+import hashlib
 import json
 import os
+import sqlite3
 import sys
+import tempfile
+import threading
+import time
+import weakref
+from multiprocessing.pool import ThreadPool
+
+from dotblox import filewatch
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+try:
+    from concurrent import futures
+except ImportError:
+    # python 2 without the futures backport
+    futures = None
+
+
+def _new_file_mode():
+    """Permissions a newly created file gets with the current umask"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+_NEW_FILE_MODE = _new_file_mode()
 
 
 class ConfigIO(object):
-    def __init__(self, file_path, read, write, default=None, sync=True):
+    def __init__(self, file_path, read, write, default=None, sync=True,
+                 watcher=None, write_delay=None, lock=False):
         """File IO class for contextual reading and writing of a
         configuration file
 
@@ -17,6 +52,16 @@ class ConfigIO(object):
                             doesnt exist.
             sync (bool): when data is read the latest is pulled from the file.
                          when data is written the file is updated on disk.
+            watcher (filewatch.WatchBackend|bool): backend used to detect
+                         changes to the file. Defaults to the shared
+                         backend. False checks the modified time on
+                         every read instead.
+            write_delay (float): when given, writes are held in memory and
+                         coalesced into a single save this many seconds
+                         after the last write. See flush()
+            lock (bool): lock the file while saving so several
+                         processes can't save at the same time. This
+                         creates a file_path + ".lock" file
 
         Usage:
             io = ConfigIO(file_path, read, write)
@@ -28,61 +73,365 @@ class ConfigIO(object):
 
         """
         self.file_path = file_path
-        self.modified_time = 0
-        self.__context_write = False
+        self.fingerprint = None
+        self.write_delay = write_delay
+        self.lock = lock
+        self._file_lock_depth = 0
         self._sync = sync
+        self._lock = threading.RLock()
+        self._pending_write = False
+        self._working = None
+        self._working_thread = None
         self._io_read = read
         self._io_write = write
 
         if default is None:
             default = {}
 
-        self.cache = {}
+        # Increases every time the cache is replaced
+        self.version = 0
+        self._cache = {}
         self.default_data = default
+        # Data as last read or saved, used to find this process's changes
+        self._saved = {}
+
+        self._dirty = True
+        self._watcher = None
+        if watcher is not False:
+            self._watcher = watcher or filewatch.get_backend()
+            self._watch()
+
+    @property
+    def cache(self):
+        return self._cache
+
+    @cache.setter
+    def cache(self, value):
+        if value is not self._cache:
+            self._cache = value
+            self.version += 1
+
+    def _watch(self):
+        """Mark the cache dirty whenever the watcher sees the file change"""
+        watcher = self._watcher
+        file_paths = self._get_watch_paths()
+
+        def on_change(path):
+            io = io_ref()
+            if io is not None:
+                io._dirty = True
+
+        def unwatch(*args):
+            for file_path in file_paths:
+                watcher.unwatch(file_path, on_change)
+
+        io_ref = weakref.ref(self, unwatch)
+        self._unwatch = unwatch
+        for file_path in file_paths:
+            watcher.watch(file_path, on_change)
+
+    def _get_watch_paths(self):
+        """Get the files that make up the config on disk"""
+        return [self.file_path]
+
+    def _get_fingerprint(self):
+        """Get a cheap signature of the file on disk to avoid needless reads
+
+        Returns:
+            tuple|None: None when the file does not exist
+        """
+        try:
+            stat = os.stat(self.file_path)
+        except OSError:
+            return None
+        return stat.st_mtime, stat.st_size
+
+    def _stat(self):
+        """Get the fingerprint, recorded in the metrics"""
+        _metrics.count(self.file_path, "stat_calls")
+        return self._get_fingerprint()
+
+    def _read(self):
+        """Load the data, recorded in the metrics"""
+        _metrics.count(self.file_path, "disk_reads")
+        with _metrics.timer(self.file_path, "read_latency"):
+            return self._load()
+
+    def _load(self):
+        """Load the data from disk
+
+        Returns:
+            dict: data to be cached
+        """
+        with open(self.file_path, "r") as f:
+            if _metrics.enabled:
+                _metrics.count(self.file_path, "bytes_read",
+                               os.fstat(f.fileno()).st_size)
+            return self._io_read(f)
 
     def save_to_disk(self):
+        """Save the cache to disk
+
+        If another process saved since the file was last read, only the
+        changes made by this process are applied on top of the file.
+
+        The data is written to a temporary file next to the config which
+        then replaces it, so the config is never left half written.
+        """
+        with self._lock, _metrics.timer(self.file_path, "write_latency"):
+            _write_behind.cancel(self)
+            self._pending_write = False
+            try:
+                with self._file_lock():
+                    fingerprint = self._stat()
+                    if fingerprint != self.fingerprint:
+                        self._merge(fingerprint,
+                                    list(diff_data(self._saved, self.cache)))
+                    self._atomic_write()
+                    # Our own write does not need to be read back in
+                    self.fingerprint = self._stat()
+            except:
+                print("Unable to save to " + self.file_path)
+                return
+            self._saved = self.cache
+
+    def _merge(self, fingerprint, records):
+        """Apply this process's changes to the latest data on disk
+
+        Args:
+            fingerprint: current fingerprint of the file
+            records (list): changes from diff_data
+        """
+        if fingerprint is None:
+            data = copy.deepcopy(self.default_data)
+        else:
+            data = self._read()
+        self.cache = apply_diff(data, records)
+        self.fingerprint = fingerprint
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        """Hold an advisory lock on file_path + ".lock" when locking is on"""
+        fd = None
+        if self.lock and not self._file_lock_depth:
+            try:
+                fd = os.open(self.file_path + ".lock",
+                             os.O_RDWR | os.O_CREAT,
+                             _NEW_FILE_MODE)
+            except OSError:
+                # Can't write next to the file so there is nothing to protect
+                pass
+
+        if fd is not None:
+            try:
+                _lock_file(fd)
+            except:
+                os.close(fd)
+                raise
+
+        # Nested calls reuse the lock as closing a second descriptor to
+        # the same file would release it
+        self._file_lock_depth += 1
         try:
-            with open(self.file_path, "w") as f:
-                self._io_write(f, self.cache)
+            yield
+        finally:
+            self._file_lock_depth -= 1
+            if fd is not None:
+                _unlock_file(fd)
+                os.close(fd)
+
+    def _atomic_write(self):
+        """Write the cache to a temporary file that then replaces the file
+
+        Shared configs may be writable by a user that can't create files
+        next to them, those are written in place instead. Symbolic links are
+        followed so the file they point to is the one replaced.
+        """
+        file_path = os.path.realpath(self.file_path)
+        directory, name = os.path.split(file_path)
+        try:
+            fd, temp_path = tempfile.mkstemp(prefix="." + name + ".",
+                                             suffix=".tmp",
+                                             dir=directory)
+        except OSError:
+            if not os.access(file_path, os.W_OK):
+                raise
+            with open(file_path, "w") as f:
+                self._write_file(f)
+            return
+
+        try:
+            with os.fdopen(fd, "w") as f:
+                self._write_file(f)
+            if os.path.exists(file_path):
+                stat = os.stat(file_path)
+                # Keep the group so the rest of it can still save the file
+                _chown(temp_path, stat.st_gid)
+                mode = stat.st_mode & 0o7777
+            else:
+                mode = _NEW_FILE_MODE
+            os.chmod(temp_path, mode)
+            _replace(temp_path, file_path)
         except:
-            print("Unable to save to " + self.file_path)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _write_file(self, f):
+        """Write the cache to the open file and make sure it is on disk"""
+        self._io_write(f, self.cache)
+        f.flush()
+        os.fsync(f.fileno())
+        if _metrics.enabled:
+            _metrics.count(self.file_path, "bytes_written",
+                           os.fstat(f.fileno()).st_size)
+
+    def flush(self):
+        """Save any writes still waiting on the write delay"""
+        with self._lock:
+            if self._pending_write:
+                self.save_to_disk()
+
+    def close(self):
+        """Save any pending writes and stop watching the file"""
+        self.flush()
+        if self._watcher is not None:
+            self._unwatch()
+            self._watcher = None
+
+    def has_pending_write(self):
+        """Check if there are writes that have not been saved yet"""
+        return self._pending_write
 
     def read_from_disk(self, force=False):
         """Read the file from disk.
 
-        This checks the modified time of the file as to avoid subsequent
-        reads
+        When watching, the disk is only touched after the watcher
+        reports a change. Otherwise the fingerprint (modified time and
+        size) of the file is checked as to avoid subsequent reads
 
         Args:
-            force (bool): forces a read from disk even if the modified
-                           time is the same
+            force (bool): forces a read from disk even if the fingerprint
+                           is the same
 
         Returns:
             dict: data from the configuration
         """
-        if not os.path.exists(self.file_path):
-            self.cache = copy.copy(self.default_data)
+        if not (force or self._pending_write) \
+                and self._watcher is not None and not self._dirty:
+            _metrics.count(self.file_path, "cache_hits")
             return
 
-        last_modified = os.path.getmtime(self.file_path)
-        if self.modified_time < last_modified or force:
-            self.modified_time = last_modified
-            with open(self.file_path, "r") as f:
-                self.cache = self._io_read(f)
+        with self._lock:
+            if self._pending_write:
+                if not force:
+                    # Unsaved changes take priority over the file on disk
+                    _metrics.count(self.file_path, "cache_hits")
+                    return
+                _write_behind.cancel(self)
+                self._pending_write = False
+
+            if self._watcher is not None:
+                if not (self._dirty or force):
+                    _metrics.count(self.file_path, "cache_hits")
+                    return
+                # Cleared before reading so a change during the read is kept
+                self._dirty = False
+
+            fingerprint = self._stat()
+            if fingerprint is None:
+                self.cache = self._saved = self.default_data
+                self.fingerprint = None
+                return
+
+            if fingerprint != self.fingerprint or force:
+                self.fingerprint = fingerprint
+                self.cache = self._saved = self._read()
+            else:
+                _metrics.count(self.file_path, "cache_hits")
+
+    def in_transaction(self):
+        """Check if the current thread is within a transaction
+
+        Reads then return the working data, which is not part of any
+        version until the transaction is saved.
+        """
+        return self._working is not None \
+            and self._working_thread == _get_thread_id()
 
     def __enter__(self):
+        """Get a read only snapshot of the data
+
+        The snapshot never changes, writes replace the cache with a new
+        version that shares everything that was not changed.
+        """
+        working = self._working
+        if working is not None and self._working_thread == _get_thread_id():
+            return FrozenDict(working[0])
         if self._sync:
             self.read_from_disk()
-        return self.cache
+        return FrozenDict(self.cache)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if self.__context_write and self._sync:
-            self.save_to_disk()
+        pass
 
+    @contextlib.contextmanager
     def write(self):
-        """Use in a with statement to auto save the file when sync is on"""
-        self.__context_write = True
-        return self
+        """Use in a with statement to auto save the file when sync is on
+
+        Only the branches of the data that are accessed are copied, the
+        changes are discarded if an exception is raised.
+        """
+        with self.transaction() as data:
+            yield data
+
+    @contextlib.contextmanager
+    def transaction(self, validate=None):
+        """Group reads and writes into a single read and a single save
+
+        Any reads or writes within the transaction use the working data.
+        If an exception is raised the changes are discarded and nothing
+        is saved. Nested transactions join the outer one.
+
+        Args:
+            validate (func): called with the data before saving. Raise to
+                             roll back the changes
+
+        Usage:
+            with io.transaction() as data:
+                data["key"] = value
+                with io.write() as data:
+                    data["other"] = value
+        """
+        with self._lock:
+            if self._working is not None:
+                yield _WriteProxy(*self._working)
+                return
+
+            if self._sync:
+                self.read_from_disk()
+            root = dict(self.cache)
+            self._working = (root, {id(root)})
+            self._working_thread = _get_thread_id()
+            try:
+                yield _WriteProxy(*self._working)
+                if validate is not None:
+                    validate(root)
+            finally:
+                self._working = None
+                self._working_thread = None
+
+            self.cache = root
+            if self._sync:
+                self._modified()
+
+    def _modified(self):
+        """Save now or schedule a save based on the write delay"""
+        if self.write_delay is None:
+            self.save_to_disk()
+            return
+        self._pending_write = True
+        _write_behind.schedule(self)
 
     def pause_sync(self):
         """Pause syncing"""
@@ -99,20 +448,1076 @@ class ConfigIO(object):
         if save:
             self.save_to_disk()
 
+    def submit_read(self, callback=None):
+        """Read the file on the config io thread
+
+        Args:
+            callback (func): called with the future once done, from the
+                             io thread. See dotblox.qt.mainthread to
+                             get it on the Qt thread
+
+        Returns:
+            concurrent.futures.Future: resolves to a read only snapshot
+        """
+        return _submit(self._read_snapshot, callback)
+
+    def submit_write(self, mutator, validate=None, callback=None):
+        """Change the data on the config io thread
+
+        The mutator runs in a transaction, see transaction(). Writes
+        are applied in the order they were submitted.
+
+        Args:
+            mutator (func): called with the writable data
+            validate (func): checks the data before it is saved
+            callback (func): called with the future once done, from the
+                             io thread
+
+        Returns:
+            concurrent.futures.Future: resolves to what mutator returned
+        """
+        return _submit(lambda: self._apply(mutator, validate), callback)
+
+    def _read_snapshot(self):
+        with self as data:
+            return data
+
+    def _apply(self, mutator, validate):
+        with self.transaction(validate=validate) as data:
+            return mutator(data)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _submit(func, callback=None):
+    """Run the function on the single config io thread
+
+    A single thread keeps reads and writes in the order they were
+    submitted.
+
+    Returns:
+        concurrent.futures.Future
+    """
+    global _executor
+    if futures is None:
+        raise NotImplementedError("Asynchronous config io needs concurrent.futures")
+    with _executor_lock:
+        if _executor is None:
+            _executor = futures.ThreadPoolExecutor(max_workers=1)
+    future = _executor.submit(func)
+    if callback is not None:
+        future.add_done_callback(callback)
+    return future
+
+
+try:
+    from collections.abc import Mapping, MutableMapping, Sequence
+except ImportError:
+    from collections import Mapping, MutableMapping, Sequence
+
+try:
+    from threading import get_ident as _get_thread_id
+except ImportError:
+    from thread import get_ident as _get_thread_id
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return FrozenDict(value)
+    if isinstance(value, list):
+        return FrozenList(value)
+    return value
+
+
+def _thaw(value):
+    """Get the data behind a read only view"""
+    if isinstance(value, (FrozenDict, FrozenList)):
+        # Never modified so it can be shared
+        return value._data
+    return value
+
+
+class FrozenDict(Mapping):
+    def __init__(self, data):
+        """Read only view of a dictionary from a config
+
+        Nested dictionaries and lists are returned as read only views.
+        Use copy() to get a mutable copy.
+        """
+        self._data = data
+
+    def __getitem__(self, key):
+        return _freeze(dict.__getitem__(self._data, key))
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return "FrozenDict(%r)" % self._data
+
+    def copy(self):
+        return copy.deepcopy(self._data)
+
+
+class FrozenList(Sequence):
+    def __init__(self, data):
+        """Read only view of a list from a config
+
+        Use copy() to get a mutable copy.
+        """
+        self._data = data
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return FrozenList(self._data[index])
+        return _freeze(self._data[index])
+
+    def __contains__(self, value):
+        return value in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def __eq__(self, other):
+        if isinstance(other, FrozenList):
+            other = other._data
+        return isinstance(other, (list, tuple)) and list(self._data) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "FrozenList(%r)" % self._data
+
+    def copy(self):
+        return copy.deepcopy(self._data)
+
+
+class _WriteProxy(MutableMapping):
+    def __init__(self, data, owned):
+        """Copy on write access to a dictionary within a transaction
+
+        Nested dictionaries are copied the first time they are accessed
+        and lists are copied as a whole, everything else stays shared
+        with the previous version of the data.
+
+        Args:
+            data (dict): dictionary owned by the transaction
+            owned (set): ids of the containers copied by the transaction
+        """
+        self._data = data
+        self._owned = owned
+
+    def __getitem__(self, key):
+        value = self._data[key]
+        if isinstance(value, (dict, list)) and id(value) not in self._owned:
+            value = dict(value) if isinstance(value, dict) else copy.deepcopy(value)
+            self._data[key] = value
+            self._owned.add(id(value))
+        if isinstance(value, dict):
+            return _WriteProxy(value, self._owned)
+        return value
+
+    def __setitem__(self, key, value):
+        if isinstance(value, _WriteProxy):
+            value = value._data
+        elif isinstance(value, (dict, list)):
+            # Copied so the caller can't change it later
+            value = copy.deepcopy(value)
+            self._owned.add(id(value))
+        else:
+            value = _thaw(value)
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        del self._data[key]
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return "_WriteProxy(%r)" % self._data
+
+
+def _lock_file(fd):
+    """Block until an exclusive lock on the open file is acquired"""
+    if fcntl is not None:
+        fcntl.lockf(fd, fcntl.LOCK_EX)
+    else:
+        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+
+
+def _unlock_file(fd):
+    if fcntl is not None:
+        fcntl.lockf(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+def _replace(src, dst):
+    """Atomically move src over dst"""
+    if hasattr(os, "replace"):
+        os.replace(src, dst)
+    else:
+        # python 2: rename only replaces existing files on posix
+        if os.name == "nt" and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+def _chown(path, gid):
+    """Set the group of the file, ignored when not allowed"""
+    if not hasattr(os, "chown"):
+        return
+    try:
+        os.chown(path, -1, gid)
+    except OSError:
+        pass
+
+
+class _WriteBehind(object):
+    # Bursts of writes are saved at most this many write delays later
+    MAX_DELAY_FACTOR = 5
+
+    def __init__(self):
+        """Saves ConfigIO's with pending writes from a background thread"""
+        self._condition = threading.Condition()
+        self._pending = {}
+        self._thread = None
+
+    def schedule(self, io):
+        """Save the io once it has not been written to for its write delay
+
+        Args:
+            io (ConfigIO): io with a pending write
+        """
+        now = time.time()
+        with self._condition:
+            first = self._pending.get(io, (now, None))[0]
+            deadline = min(now + io.write_delay,
+                           first + io.write_delay * self.MAX_DELAY_FACTOR)
+            self._pending[io] = (first, deadline)
+            if self._thread is None:
+                atexit.register(self.flush_all)
+                self._thread = threading.Thread(target=self._run,
+                                                name="dotblox-config-write")
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify()
+
+    def cancel(self, io):
+        with self._condition:
+            self._pending.pop(io, None)
+
+    def flush_all(self):
+        """Save every io with a pending write"""
+        with self._condition:
+            pending = list(self._pending)
+            self._pending.clear()
+        for io in pending:
+            io.flush()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._pending:
+                    self._condition.wait()
+                    continue
+                io, (_, deadline) = min(self._pending.items(),
+                                        key=lambda x: x[1][1])
+                timeout = deadline - time.time()
+                if timeout > 0:
+                    self._condition.wait(timeout)
+                    continue
+                del self._pending[io]
+            io.flush()
+
+
+_write_behind = _WriteBehind()
+
+# Set to 1 to record metrics from the start of the session
+METRICS_ENV = "DOTBLOX_CONFIG_METRICS"
+
+
+class _NullTimer(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer(object):
+    def __init__(self, metrics, path, name):
+        self._metrics = metrics
+        self._path = path
+        self._name = name
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.time()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._metrics.latency(self._path, self._name,
+                              time.time() - self._start)
+
+
+def _new_path_metrics():
+    metrics = dict((x, 0) for x in _Metrics.COUNTERS)
+    for name in _Metrics.LATENCIES:
+        metrics[name] = {"count": 0,
+                         "total": 0.0,
+                         "max": 0.0,
+                         "buckets": [0] * (len(_Metrics.LATENCY_BUCKETS) + 1)}
+    return metrics
+
+
+class _Metrics(object):
+    COUNTERS = ("disk_reads", "cache_hits", "stat_calls",
+                "bytes_read", "bytes_written")
+    LATENCIES = ("read_latency", "write_latency")
+    # Upper bound in seconds of each latency bucket, the last bucket
+    # holds everything slower
+    LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01,
+                       0.05, 0.1, 0.5, 1.0)
+
+    def __init__(self):
+        """Records what every ConfigIO costs, per config file
+
+        Nothing is recorded until enabled. See enable_metrics
+        """
+        self.enabled = os.environ.get(METRICS_ENV, "0") not in ("", "0")
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._profiles = []
+        # What enabled goes back to once every profile is done
+        self._enabled_outside_profiles = self.enabled
+
+    def _targets(self):
+        return [self._metrics] + [x.metrics for x in self._profiles]
+
+    def count(self, path, name, amount=1):
+        """Add to a counter
+
+        Args:
+            path (str): config file path
+            name (str): one of COUNTERS
+            amount (int): value to add
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            for target in self._targets():
+                if path not in target:
+                    target[path] = _new_path_metrics()
+                target[path][name] += amount
+
+    def latency(self, path, name, seconds):
+        """Add a duration to a latency histogram
+
+        Args:
+            path (str): config file path
+            name (str): one of LATENCIES
+            seconds (float): duration
+        """
+        if not self.enabled:
+            return
+        bucket = len(self.LATENCY_BUCKETS)
+        for i, bound in enumerate(self.LATENCY_BUCKETS):
+            if seconds <= bound:
+                bucket = i
+                break
+        with self._lock:
+            for target in self._targets():
+                if path not in target:
+                    target[path] = _new_path_metrics()
+                histogram = target[path][name]
+                histogram["count"] += 1
+                histogram["total"] += seconds
+                histogram["max"] = max(histogram["max"], seconds)
+                histogram["buckets"][bucket] += 1
+
+    def timer(self, path, name):
+        """Time a with block into the latency histogram
+
+        Args:
+            path (str): config file path
+            name (str): one of LATENCIES
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, path, name)
+
+    def get(self, path=None):
+        with self._lock:
+            if path is None:
+                return copy.deepcopy(self._metrics)
+            return copy.deepcopy(self._metrics.get(path, _new_path_metrics()))
+
+    def reset(self):
+        with self._lock:
+            self._metrics.clear()
+
+    def set_enabled(self, enabled):
+        with self._lock:
+            self._enabled_outside_profiles = enabled
+            if not self._profiles:
+                self.enabled = enabled
+
+    def add_profile(self, profile):
+        """Record into the profile too, metrics stay on until every
+        profile is removed"""
+        with self._lock:
+            if not self._profiles:
+                self._enabled_outside_profiles = self.enabled
+            self._profiles.append(profile)
+            self.enabled = True
+
+    def remove_profile(self, profile):
+        with self._lock:
+            self._profiles.remove(profile)
+            if not self._profiles:
+                self.enabled = self._enabled_outside_profiles
+
+
+_metrics = _Metrics()
+
+
+def enable_metrics(enabled=True):
+    """Turn recording of config metrics on or off
+
+    Metrics can also be enabled for a whole session by setting the
+    DOTBLOX_CONFIG_METRICS environment variable to 1.
+
+    Args:
+        enabled (bool): record metrics
+    """
+    _metrics.set_enabled(enabled)
+
+
+def get_metrics(path=None):
+    """Get the metrics recorded since enabled or last reset
+
+    Each config path has the counters disk_reads, cache_hits,
+    stat_calls, bytes_read and bytes_written and the histograms
+    read_latency and write_latency. Histograms have a count, total
+    and max in seconds and the buckets counts of LATENCY_BUCKETS.
+
+    Args:
+        path (str): only get the metrics of this config file
+
+    Returns:
+        dict: config path to metrics, or the metrics of the path
+    """
+    return _metrics.get(path)
+
+
+def reset_metrics():
+    """Clear every metric recorded so far"""
+    _metrics.reset()
+
+
+class ConfigProfile(object):
+    def __init__(self):
+        """Metrics recorded while a profile() block was running"""
+        self.metrics = {}
+        self.duration = 0.0
+
+    def report(self):
+        """Get a table of the config files sorted by time spent
+
+        Returns:
+            str: report
+        """
+        def spent(item):
+            metrics = item[1]
+            return sum(metrics[x]["total"] for x in _Metrics.LATENCIES)
+
+        lines = ["Config IO over %.3fs" % self.duration,
+                 "%9s %9s %6s %6s %6s %10s %10s  %s" % (
+                     "read ms", "write ms", "reads", "hits", "stats",
+                     "bytes in", "bytes out", "path")]
+        for path, metrics in sorted(self.metrics.items(), key=spent, reverse=True):
+            lines.append("%9.2f %9.2f %6d %6d %6d %10d %10d  %s" % (
+                metrics["read_latency"]["total"] * 1000,
+                metrics["write_latency"]["total"] * 1000,
+                metrics["disk_reads"],
+                metrics["cache_hits"],
+                metrics["stat_calls"],
+                metrics["bytes_read"],
+                metrics["bytes_written"],
+                path))
+        return "\n".join(lines)
+
+
+@contextlib.contextmanager
+def profile():
+    """Record the config metrics of everything run in the with block
+
+    Usage:
+        with config.profile() as result:
+            widget.refresh()
+        print(result.report())
+
+    Yields:
+        ConfigProfile: filled in as the block runs
+    """
+    result = ConfigProfile()
+    _metrics.add_profile(result)
+    start = time.time()
+    try:
+        yield result
+    finally:
+        result.duration = time.time() - start
+        _metrics.remove_profile(result)
+
+
+def diff_data(old, new, path=()):
+    """Get the changes needed to turn old into new
+
+    Dictionaries are compared key by key, any other value is replaced as
+    a whole.
+
+    Args:
+        old: previous data
+        new: current data
+        path (tuple): keys leading to old/new
+
+    Returns:
+        generator: ("set", path, value) or ("del", path) records
+    """
+    if old is new:
+        return
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old:
+            if key not in new:
+                yield "del", path + (key,)
+        for key, value in new.items():
+            if key not in old:
+                yield "set", path + (key,), value
+            else:
+                for record in diff_data(old[key], value, path + (key,)):
+                    yield record
+    elif old != new:
+        yield "set", path, new
+
+
+def apply_diff(data, records):
+    """Apply the records from diff_data to the data
+
+    Args:
+        data (dict): data to update in place
+        records (iter): records from diff_data
+
+    Returns:
+        dict: the updated data. Only differs from data when a record
+              replaces the whole thing
+    """
+    for record in records:
+        op, path = record[0], tuple(record[1])
+        if not path:
+            data = copy.deepcopy(record[2]) if op == "set" else {}
+            continue
+        parent = data
+        for key in path[:-1]:
+            child = parent.get(key)
+            if not isinstance(child, dict):
+                if op == "del":
+                    break
+                child = parent[key] = {}
+            parent = child
+        else:
+            if op == "set":
+                parent[path[-1]] = copy.deepcopy(record[2])
+            else:
+                parent.pop(path[-1], None)
+    return data
+
+
+class JournalConfigIO(ConfigIO):
+    # Size in bytes the journal can grow to before it is compacted
+    COMPACT_SIZE = 256 * 1024
+
+    def __init__(self, file_path, *args, **kwargs):
+        """ConfigIO that appends changes to a journal next to the file
+
+        The file itself is a snapshot that is only rewritten once the
+        journal grows past compact_size. Saving costs the size of the
+        change instead of the size of all the data.
+
+        Journal:
+            file_path + ".journal" with one json record per line
+        """
+        self.journal_path = file_path + ".journal"
+        self.compact_size = self.COMPACT_SIZE
+        ConfigIO.__init__(self, file_path, *args, **kwargs)
+
+    def _get_watch_paths(self):
+        return [self.file_path, self.journal_path]
+
+    def _get_fingerprint(self):
+        fingerprints = []
+        for path in self._get_watch_paths():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                fingerprints.append(None)
+                continue
+            fingerprints.append((stat.st_mtime, stat.st_size))
+        return tuple(fingerprints)
+
+    def _load(self):
+        if os.path.exists(self.file_path):
+            data = ConfigIO._load(self)
+        else:
+            data = copy.deepcopy(self.default_data)
+
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r") as f:
+                if _metrics.enabled:
+                    _metrics.count(self.file_path, "bytes_read",
+                                   os.fstat(f.fileno()).st_size)
+                data = apply_diff(data, self._read_journal(f))
+        return data
+
+    def _read_journal(self, f):
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # A partially written record from a crash
+                continue
+
+    def save_to_disk(self):
+        """Append the changes since the last save to the journal"""
+        with self._lock, _metrics.timer(self.file_path, "write_latency"):
+            _write_behind.cancel(self)
+            self._pending_write = False
+            try:
+                with self._file_lock():
+                    records = list(diff_data(self._saved, self.cache))
+                    fingerprint = self._stat()
+                    if fingerprint != self.fingerprint:
+                        # Keep the cache up to date for compacting
+                        self._merge(fingerprint, records)
+                    if records:
+                        self._append(records)
+                    if os.path.exists(self.journal_path) \
+                            and os.path.getsize(self.journal_path) > self.compact_size:
+                        self.compact()
+            except:
+                print("Unable to save to " + self.journal_path)
+                return
+            self._saved = self.cache
+            self.fingerprint = self._stat()
+
+    def _append(self, records):
+        lines = "".join(json.dumps(x, separators=(",", ":")) + "\n"
+                        for x in records)
+        _metrics.count(self.file_path, "bytes_written", len(lines))
+        with open(self.journal_path, "a+b") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    # End the record torn by a crash so ours is not lost with it
+                    lines = "\n" + lines
+            f.write(lines.encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def compact(self):
+        """Write the cache as the snapshot and clear the journal
+
+        Records are absolute so if this is interrupted replaying the old
+        journal over the new snapshot gives the same result.
+        """
+        with self._lock, self._file_lock():
+            self._atomic_write()
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+            self.fingerprint = self._stat()
+
+
+def _flatten_data(data, path=()):
+    """Get every leaf value of nested dictionaries with its keys
+
+    Args:
+        data: data to flatten
+        path (tuple): keys leading to data
+
+    Returns:
+        generator: (path, value)
+    """
+    if isinstance(data, dict) and data:
+        for key, value in data.items():
+            for leaf in _flatten_data(value, path + (key,)):
+                yield leaf
+    else:
+        yield path, data
+
+
+class SQLiteConfigIO(ConfigIO):
+    # Seconds to wait on another process holding the write lock
+    TIMEOUT = 10
+
+    def __init__(self, file_path, *args, **kwargs):
+        """ConfigIO that stores each value in its own row of a sqlite database
+
+        The database is opened in WAL mode so several processes can read
+        and write at the same time. Only the values that changed since
+        the last save are written so processes editing different keys
+        don't overwrite each other. WAL mode does not work on network
+        file systems, keep the file on a local disk.
+
+        Changes made by other processes are detected through
+        PRAGMA data_version so no file watching is needed.
+        """
+        kwargs["watcher"] = False
+        self.is_new = not os.path.exists(file_path)
+        self._connection = sqlite3.connect(file_path,
+                                           timeout=self.TIMEOUT,
+                                           isolation_level=None,
+                                           check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS config "
+                                 "(key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        ConfigIO.__init__(self, file_path, *args, **kwargs)
+
+    def migrate(self, json_path):
+        """Import a json config, including any journal, into the database
+
+        Args:
+            json_path (str): path to the json config
+        """
+        legacy = JournalConfigIO(json_path, json.load, None, watcher=False)
+        try:
+            legacy.read_from_disk()
+        except ValueError:
+            print("Unable to migrate " + json_path)
+            return
+        with self.write() as data:
+            data.update(legacy.cache)
+
+    def _get_fingerprint(self):
+        with self._lock:
+            return self._connection.execute("PRAGMA data_version").fetchone()
+
+    def _load(self):
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT key, value FROM config").fetchall()
+        if _metrics.enabled:
+            _metrics.count(self.file_path, "bytes_read",
+                           sum(len(k) + len(v) for k, v in rows))
+
+        if not rows:
+            return copy.deepcopy(self.default_data)
+
+        data = {}
+        # Parents before children so empty dictionaries are filled in
+        leaves = sorted(((json.loads(k), json.loads(v)) for k, v in rows),
+                        key=lambda x: len(x[0]))
+        for path, value in leaves:
+            if not path:
+                data = value
+                continue
+            parent = data
+            for key in path[:-1]:
+                if not isinstance(parent.get(key), dict):
+                    parent[key] = {}
+                parent = parent[key]
+            if isinstance(value, dict) and isinstance(parent.get(path[-1]), dict):
+                continue
+            parent[path[-1]] = value
+        return data
+
+    def save_to_disk(self):
+        """Write the values that changed since the last save"""
+        with self._lock, _metrics.timer(self.file_path, "write_latency"):
+            _write_behind.cancel(self)
+            self._pending_write = False
+            records = list(diff_data(self._saved, self.cache))
+            if not records:
+                return
+            try:
+                self._write_records(records)
+            except sqlite3.Error:
+                print("Unable to save to " + self.file_path)
+                return
+            self._saved = self.cache
+            # data_version only changes for other connections so the
+            # fingerprint is left alone to pick up their changes
+
+    def _write_records(self, records):
+        cursor = self._connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            emptied = set()
+            for record in records:
+                path = tuple(record[1])
+                if record[0] == "set":
+                    self._upsert(cursor, list(_flatten_data(record[2], path)))
+                else:
+                    self._delete(cursor, path)
+                    if path:
+                        emptied.add(path[:-1])
+
+            # A dictionary that lost all its keys still needs a row
+            for path in emptied:
+                value = self.cache
+                for key in path:
+                    value = value.get(key) if isinstance(value, dict) else None
+                if value == {}:
+                    self._insert(cursor, [(path, value)])
+            cursor.execute("COMMIT")
+        except:
+            cursor.execute("ROLLBACK")
+            raise
+
+    def _insert(self, cursor, leaves):
+        rows = [(json.dumps(list(k)), json.dumps(v)) for k, v in leaves]
+        if _metrics.enabled:
+            _metrics.count(self.file_path, "bytes_written",
+                           sum(len(k) + len(v) for k, v in rows))
+        cursor.executemany("INSERT OR REPLACE INTO config VALUES (?, ?)", rows)
+
+    def _upsert(self, cursor, leaves):
+        """Write the leaves, keeping what other processes saved next to them
+
+        A dictionary set from a stale cache may already have keys saved
+        by another process, so only the rows of the leaves and their
+        parents are replaced. A leaf that is not an empty dictionary
+        replaces everything under it.
+
+        Args:
+            cursor (sqlite3.Cursor): cursor within the write transaction
+            leaves (list): (path, value) from _flatten_data
+        """
+        parents = set()
+        for path, value in leaves:
+            parents.update(path[:i] for i in range(len(path)))
+            if value != {}:
+                self._delete(cursor, path, children_only=True)
+        cursor.executemany("DELETE FROM config WHERE key = ?",
+                           [(json.dumps(list(x)),) for x in parents])
+        self._insert(cursor, leaves)
+
+    def _delete(self, cursor, path, children_only=False):
+        """Delete the value at the path and everything under it
+
+        Args:
+            cursor (sqlite3.Cursor): cursor within the write transaction
+            path (tuple): keys of the value
+            children_only (bool): keep the row of the value itself
+        """
+        if not path:
+            if children_only:
+                cursor.execute("DELETE FROM config WHERE key != '[]'")
+            else:
+                cursor.execute("DELETE FROM config")
+            return
+        key = json.dumps(list(path))
+        prefix = key[:-1] + ", "
+        if children_only:
+            cursor.execute("DELETE FROM config WHERE substr(key, 1, ?) = ?",
+                           (len(prefix), prefix))
+            return
+        cursor.execute("DELETE FROM config WHERE key = ? "
+                       "OR substr(key, 1, ?) = ?",
+                       (key, len(prefix), prefix))
+
+    def close(self):
+        """Save any pending writes and close the database"""
+        self.flush()
+        with self._lock:
+            self._connection.close()
+
+
+class _IORegistry(object):
+    def __init__(self):
+        """Shares a single ConfigIO between every config of the same file
+
+        The io is closed once every config using it has been closed or
+        garbage collected.
+        """
+        self._lock = threading.RLock()
+        self._entries = {}
+        # (key, weak reference) of owners that were garbage collected
+        self._collected = collections.deque()
+
+    def acquire(self, key, owner, factory):
+        """Get the io for the key, creating it if needed
+
+        Args:
+            key (tuple): identifies the io
+            owner (object): object using the io
+            factory (func): creates the io when it does not exist
+
+        Returns:
+            ConfigIO
+        """
+        self._release_collected()
+        collected = self._collected
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = (factory(), [])
+            entry[1].append(weakref.ref(owner,
+                                        lambda ref: collected.append((key, ref))))
+            return entry[0]
+
+    def release(self, key, owner):
+        """Stop the owner from using the io for the key"""
+        with self._lock:
+            entry = self._entries.get(key)
+            refs = [x for x in entry[1] if x() is owner] if entry else []
+        for ref in refs:
+            self._release(key, ref)
+        self._release_collected()
+
+    def _release_collected(self):
+        """Release the owners that were garbage collected
+
+        The weak reference callbacks only queue them as closing saves to
+        disk, which should not run from within the garbage collector.
+        """
+        while True:
+            try:
+                key, ref = self._collected.popleft()
+            except IndexError:
+                return
+            self._release(key, ref)
+
+    def _release(self, key, ref):
+        with self._lock:
+            entry = self._entries.get(key)
+            # Compared by identity, weak references compare their objects
+            if entry is None or not any(x is ref for x in entry[1]):
+                return
+            entry[1][:] = [x for x in entry[1] if x is not ref]
+            if entry[1]:
+                return
+            del self._entries[key]
+        entry[0].close()
+
+    def get_owner(self, key):
+        """Get an object still using the io for the key
+
+        Returns:
+            object|None: None once every owner is gone
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            for ref in entry[1] if entry else []:
+                owner = ref()
+                if owner is not None:
+                    return owner
+        return None
+
+    def get(self, key):
+        """Get the io for the key if it is in use"""
+        self._release_collected()
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] if entry else None
+
+
+_io_registry = _IORegistry()
+
+
+class _OwnerHook(object):
+    def __init__(self, key, name):
+        """Calls a method of a config sharing the io without holding on to it
+
+        A bound method would keep the config that created the io alive,
+        so the io could never be closed.
+
+        Args:
+            key (tuple): io key, see _get_io_key
+            name (str): method name
+        """
+        self._key = key
+        self._name = name
+
+    def __call__(self, *args):
+        owner = _io_registry.get_owner(self._key)
+        if owner is None:
+            # Saving pending writes after the last config was collected
+            config_class = self._key[0]
+            owner = config_class.__new__(config_class)
+        return getattr(owner, self._name)(*args)
+
+
+def get_shared_io(config_class, path):
+    """Get the ConfigIO shared by configs of the class and path
+
+    Args:
+        config_class (type): BaseConfig subclass
+        path (str): path of the config
+
+    Returns:
+        ConfigIO|None: None when no config is using the file
+    """
+    return _io_registry.get(_get_io_key(config_class, path))
+
+
+def _get_io_key(config_class, path):
+    return config_class, os.path.normcase(os.path.abspath(path))
+
 
 class BaseConfig(object):
-    def __init__(self, path, default=None):
+    io_class = ConfigIO
+
+    def __init__(self, path, default=None, write_delay=None, lock=False):
         """Base class for config files.
 
         _io_read and io_write must be implemented in subsequent classes
 
+        Configs of the same class and path share a single ConfigIO
+        within the process, so the file is only read and watched once.
+        The options of the first config created for the file are used.
+        The io is closed once every config using it is gone.
+
         Args:
             path (str): the fie path of the config
             default (dict): default data to fill the file
+            write_delay (float): coalesce writes and save them this many
+                                 seconds later. See ConfigIO
+            lock (bool): lock the file while saving. See ConfigIO
         """
         self.path = path
-        self.io = ConfigIO(path, self._io_read, self._io_write, default=default)
-        self.io.read_from_disk()
+        io_class = self.io_class
+        key = self._io_key = _get_io_key(type(self), path)
+        self.io = _io_registry.acquire(
+            key, self,
+            lambda: io_class(path,
+                             _OwnerHook(key, "_io_read"),
+                             _OwnerHook(key, "_io_write"),
+                             default=default,
+                             write_delay=write_delay,
+                             lock=lock))
+        with self.io:
+            pass
 
     def _io_read(self, f):
         """The function to be used when reading the file
@@ -149,6 +1554,38 @@ class BaseConfig(object):
         """Save current contents to disk"""
         self.io.save_to_disk()
 
+    def flush(self):
+        """Save any writes still waiting on the write delay"""
+        self.io.flush()
+
+    def close(self):
+        """Stop using the io, it is closed once no other config uses it"""
+        _io_registry.release(self._io_key, self)
+
+    def batch(self):
+        """Group many changes into a single read and a single save
+
+        The changes are rolled back if an exception is raised or the data
+        does not pass validate.
+
+        Usage:
+            with config.batch():
+                config.update_label(root, label)
+                config.update_root(root, new_root)
+        """
+        return self.io.transaction(validate=self.validate)
+
+    def validate(self, data):
+        """Check the data before it is saved from a batch
+
+        Args:
+            data (dict): data about to be saved
+
+        Raises:
+            ValueError: when the data is invalid
+        """
+        pass
+
     def __eq__(self, other):
         return self.path == other or self != other
 
@@ -156,9 +1593,40 @@ class BaseConfig(object):
         """Revert the file from the current contents on disk"""
         self.io.read_from_disk(force=True)
 
+    def aread(self):
+        """Read the config without blocking the event loop
+
+        Usage:
+            data = await config.aread()
+
+        Returns:
+            asyncio.Future: resolves to a read only snapshot
+        """
+        import asyncio
+        return asyncio.wrap_future(self.io.submit_read())
+
+    def awrite(self, mutator):
+        """Change the config without blocking the event loop
+
+        The mutator runs in a batch on the config io thread so the
+        changes are validated and rolled back on error. See batch()
+
+        Usage:
+            await config.awrite(lambda data: data.update(values))
+
+        Args:
+            mutator (func): called with the writable data
+
+        Returns:
+            asyncio.Future: resolves to what mutator returned
+        """
+        import asyncio
+        return asyncio.wrap_future(
+            self.io.submit_write(mutator, validate=self.validate))
+
 
 class ConfigJSON(BaseConfig):
-    def __init__(self, path, default=None):
+    def __init__(self, path, default=None, write_delay=None, lock=False):
         """Base Class for reading and writing a json file
 
         This class is meant to be inherited.
@@ -173,7 +1641,34 @@ class ConfigJSON(BaseConfig):
                         data.update(data)
 
         """
-        BaseConfig.__init__(self, path, default)
+        BaseConfig.__init__(self, path, default, write_delay=write_delay,
+                            lock=lock)
+
+    def _io_read(self, f):
+        return json.load(f)
+
+    def _io_write(self, f, data):
+        json.dump(data, f, indent=4)
+
+
+class ConfigJournal(BaseConfig):
+    io_class = JournalConfigIO
+
+    def __init__(self, path, default=None, write_delay=None, lock=False,
+                 compact_size=None):
+        """Base Class for a json file with changes saved to a journal
+
+        Reads the same as ConfigJSON so existing json files can be
+        switched over. See JournalConfigIO
+
+        Args:
+            compact_size (int): size in bytes the journal can grow to
+                                before it is written back to the file
+        """
+        BaseConfig.__init__(self, path, default, write_delay=write_delay,
+                            lock=lock)
+        if compact_size is not None:
+            self.io.compact_size = compact_size
 
     def _io_read(self, f):
         return json.load(f)
@@ -182,39 +1677,193 @@ class ConfigJSON(BaseConfig):
         json.dump(data, f, indent=4)
 
 
-def _path_find_generator(name):
-    """Search for a config given the file name along sys.path
+class ConfigSQLite(BaseConfig):
+    io_class = SQLiteConfigIO
+
+    def __init__(self, path, default=None, write_delay=None,
+                 migrate_from=None):
+        """Base Class for a config stored in a sqlite database
+
+        Used the same as ConfigJSON but safe to share between processes.
+        See SQLiteConfigIO
+
+        Args:
+            migrate_from (str): json config to import when the database
+                                is created
+        """
+        BaseConfig.__init__(self, path, default, write_delay=write_delay)
+        if self.io.is_new:
+            self.io.is_new = False
+            if migrate_from and os.path.exists(migrate_from):
+                self.io.migrate(migrate_from)
+
+
+# sys.path entries are checked on a thread pool past this many entries
+PARALLEL_THRESHOLD = 8
+
+# Directories modified more recently than this (seconds) are always
+# rechecked as their modified time may not have ticked over yet
+_MTIME_RESOLUTION = 2
+
+__THREAD_POOL = None
+__DISCOVERY_INDEX = None
+__DISCOVERY_LOCK = threading.Lock()
+
+
+def _parallel_map(func, items):
+    """Map over the items on a shared thread pool when there are enough
 
     Args:
-        name (str): exact file name to search for
+        func (func): function to call with each item
+        items (list): items to map
 
     Returns:
-        generator: generator object holding the paths
+        list: results in the same order as items
     """
-    seen = []
+    global __THREAD_POOL
+    if len(items) < PARALLEL_THRESHOLD:
+        return [func(x) for x in items]
+    with __DISCOVERY_LOCK:
+        if __THREAD_POOL is None:
+            # Stat calls release the GIL so threads are enough
+            __THREAD_POOL = ThreadPool(16)
+    return __THREAD_POOL.map(func, items)
+
+
+def _get_directory_mtime(path):
+    try:
+        return os.stat(path or ".").st_mtime
+    except OSError:
+        return None
+
+
+def _get_search_paths():
+    """Get sys.path with slashes sanitized and duplicates removed"""
+    seen = set()
+    paths = []
     for path in sys.path:
         # Sanitize paths just in case
         path = path.replace("\\", '/')
         # In case sys.path has multiples and has different slashes in the path
         if path in seen:
             continue
-        seen.append(path)
+        seen.add(path)
+        paths.append(path)
+    return paths
 
-        config_path = os.path.join(path, name)
-        config_path = config_path.replace("\\", '/')
-        if not os.path.exists(config_path):
-            continue
 
-        yield config_path
+class DiscoveryIndex(ConfigJSON):
+    # Number of sys.path/name combinations to remember
+    MAX_ENTRIES = 16
+
+    def __init__(self):
+        """Remembers where configs were found along sys.path
 
+        Entries are keyed by a hash of the file name and sys.path. Each
+        stores the modified time of every directory searched, a file
+        can only appear or disappear if its directory's modified time
+        changes, so only changed directories are searched again.
+        """
+        ConfigJSON.__init__(self,
+                            get_global_settings_file("config-index.dblx", create=False),
+                            write_delay=1.0)
+
+    def find_all(self, name, paths, refresh=False):
+        """Find all configs with the given name along the paths
+
+        Args:
+            name (str): Name of file including the extension
+            paths (list): directories to search in order
+            refresh (bool): ignore the index and search every path
+
+        Returns:
+            list: config paths
+        """
+        key = hashlib.sha1(json.dumps([name, paths]).encode("utf-8")).hexdigest()
+        try:
+            with self.io as data:
+                entry = data.get(key)
+        except (ValueError, OSError, IOError):
+            self.discard()
+            entry = None
+
+        if entry is None or refresh or len(entry["mtimes"]) != len(paths):
+            entry = {"mtimes": [None] * len(paths), "found": []}
+
+        config_paths = [os.path.join(x, name).replace("\\", '/') for x in paths]
+        mtimes = _parallel_map(_get_directory_mtime, paths)
+        changed = [config_paths[i] for i, mtime in enumerate(mtimes)
+                   if mtime is None or mtime != entry["mtimes"][i]]
+
+        found = set(entry["found"])
+        for config_path, exists in zip(changed, _parallel_map(os.path.exists, changed)):
+            if exists:
+                found.add(config_path)
+            else:
+                found.discard(config_path)
+        result = [x for x in config_paths if x in found]
 
-def find_all(name):
+        now = time.time()
+        mtimes = [x if x is not None and now - x > _MTIME_RESOLUTION else None
+                  for x in mtimes]
+        if mtimes != entry["mtimes"] or result != entry["found"]:
+            with self.io.write() as data:
+                data[key] = {"mtimes": mtimes, "found": result, "time": now}
+                for old in sorted(data, key=lambda x: data[x].get("time", 0))[:-self.MAX_ENTRIES]:
+                    del data[old]
+        return result
+
+    def discard(self):
+        """Forget everything, used when the file can't be read
+
+        The index is only a cache, every directory is searched again.
+        """
+        _discard_file(self.path)
+        self.io.read_from_disk(force=True)
+
+
+def _discard_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _get_discovery_index():
+    global __DISCOVERY_INDEX
+    with __DISCOVERY_LOCK:
+        if __DISCOVERY_INDEX is None:
+            try:
+                __DISCOVERY_INDEX = DiscoveryIndex()
+            except (ValueError, OSError, IOError):
+                # Unreadable, it is rebuilt by the next search
+                _discard_file(get_global_settings_file("config-index.dblx",
+                                                       create=False))
+                __DISCOVERY_INDEX = DiscoveryIndex()
+    return __DISCOVERY_INDEX
+
+
+def _close_discovery_index():
+    """Save and close the discovery index, the next search opens it again"""
+    global __DISCOVERY_INDEX
+    with __DISCOVERY_LOCK:
+        index, __DISCOVERY_INDEX = __DISCOVERY_INDEX, None
+    if index is not None:
+        index.close()
+
+
+def find_all(name, refresh=False):
     """Find all configs with the given name along sys.path
 
+    Results are remembered between sessions and only directories that
+    changed since the last search are checked again.
+
     Args:
         name (str): Name of file including the extension
+        refresh (bool): search every directory again
     """
-    return list(_path_find_generator(name))
+    return _get_discovery_index().find_all(name, _get_search_paths(),
+                                           refresh=refresh)
 
 
 def find_one(name):
@@ -223,10 +1872,8 @@ def find_one(name):
     Args:
         name (str): Name of file including the extension
     """
-    try:
-        return next(_path_find_generator(name))
-    except StopIteration:
-        return None
+    found = find_all(name)
+    return found[0] if found else None
 
 
 def get_global_settings_folder(create=True):
@@ -0,0 +1,642 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+# Set to "poll" to force the polling backend
+BACKEND_ENV = "DOTBLOX_WATCH_BACKEND"
+# Seconds without a change before the WatchService delivers a batch
+DEBOUNCE_DELAY = 0.2
+# Seconds a batch is held back at most while changes keep coming
+DEBOUNCE_MAX_DELAY = 2.0
+
+# File systems where inotify will not see changes made by other hosts
+NETWORK_FILE_SYSTEMS = ("nfs", "nfs4", "cifs", "smbfs", "smb3", "afs",
+                        "ceph", "glusterfs", "lustre", "gpfs", "9p",
+                        "fuse.sshfs", "fuse.glusterfs", "fuse.ceph")
+
+
+class WatchBackend(object):
+    def __init__(self):
+        """Base class for notifying when files change on disk
+
+        Callbacks are called from a background thread with the path
+        that changed. They should do as little as possible, e.g. mark
+        a cache as dirty.
+
+        Usage:
+            backend = get_backend()
+            backend.watch(file_path, callback)
+            backend.unwatch(file_path, callback)
+            backend.watch_directory(directory, callback)
+
+        """
+        self._lock = threading.RLock()
+        self._callbacks = {}
+        self._directory_callbacks = {}
+
+    def watch(self, path, callback):
+        """Call the callback whenever the given file changes
+
+        Args:
+            path (str): file path to watch. Does not need to exist
+            callback (func): called with the path when it changes
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            callbacks = self._callbacks.setdefault(path, [])
+            if callback in callbacks:
+                return
+            callbacks.append(callback)
+            if len(callbacks) == 1:
+                self._add_path(path)
+
+    def unwatch(self, path, callback):
+        """Stop calling the callback when the given file changes
+
+        Args:
+            path (str): file path being watched
+            callback (func): callback given to watch
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            callbacks = self._callbacks.get(path)
+            if not callbacks or callback not in callbacks:
+                return
+            callbacks.remove(callback)
+            if not callbacks:
+                del self._callbacks[path]
+                self._remove_path(path)
+
+    def watch_directory(self, path, callback):
+        """Call the callback whenever an item is added to, removed
+        from or renamed in the directory. inotify also reports files
+        written in it, polling only sees the directory's modified time
+
+        Args:
+            path (str): directory path to watch
+            callback (func): called with the directory path when it changes
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            callbacks = self._directory_callbacks.setdefault(path, [])
+            if callback in callbacks:
+                return
+            callbacks.append(callback)
+            if len(callbacks) == 1:
+                self._add_directory(path)
+
+    def unwatch_directory(self, path, callback):
+        """Stop calling the callback when the directory changes
+
+        Args:
+            path (str): directory path being watched
+            callback (func): callback given to watch_directory
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            callbacks = self._directory_callbacks.get(path)
+            if not callbacks or callback not in callbacks:
+                return
+            callbacks.remove(callback)
+            if not callbacks:
+                del self._directory_callbacks[path]
+                self._remove_directory(path)
+
+    def is_watched(self, path):
+        with self._lock:
+            path = os.path.abspath(path)
+            return path in self._callbacks or path in self._directory_callbacks
+
+    def _notify(self, path):
+        with self._lock:
+            callbacks = list(self._callbacks.get(path, []))
+        for callback in callbacks:
+            try:
+                callback(path)
+            except Exception:
+                pass
+
+    def _notify_directory(self, path):
+        with self._lock:
+            callbacks = list(self._directory_callbacks.get(path, []))
+        for callback in callbacks:
+            try:
+                callback(path)
+            except Exception:
+                pass
+
+    def _add_path(self, path):
+        raise NotImplementedError("%s._add_path must be implented" % self.__class__.__name__)
+
+    def _remove_path(self, path):
+        raise NotImplementedError("%s._remove_path must be implented" % self.__class__.__name__)
+
+    def _add_directory(self, path):
+        raise NotImplementedError("%s._add_directory must be implented" % self.__class__.__name__)
+
+    def _remove_directory(self, path):
+        raise NotImplementedError("%s._remove_directory must be implented" % self.__class__.__name__)
+
+
+def _fingerprint(path):
+    """Get a cheap signature of the file to compare against
+
+    Args:
+        path (str): file path
+
+    Returns:
+        tuple|None: None if the file does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size, stat.st_ino
+
+
+class PollingBackend(WatchBackend):
+    def __init__(self, interval=1.0):
+        """Watch files by polling them on a background thread
+
+        Args:
+            interval (float): seconds between each poll
+        """
+        WatchBackend.__init__(self)
+        self.interval = interval
+        self._fingerprints = {}
+        # A directory's modified time changes when its items do
+        self._directory_fingerprints = {}
+        self._thread = None
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run,
+                                            name="dotblox-watch-poll")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _add_path(self, path):
+        self._fingerprints[path] = _fingerprint(path)
+        self._start()
+
+    def _remove_path(self, path):
+        self._fingerprints.pop(path, None)
+
+    def _add_directory(self, path):
+        self._directory_fingerprints[path] = _fingerprint(path)
+        self._start()
+
+    def _remove_directory(self, path):
+        self._directory_fingerprints.pop(path, None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self._poll(self._fingerprints, self._notify)
+            self._poll(self._directory_fingerprints, self._notify_directory)
+
+    def _poll(self, fingerprints, notify):
+        with self._lock:
+            paths = list(fingerprints)
+        for path in paths:
+            fingerprint = _fingerprint(path)
+            with self._lock:
+                if path not in fingerprints \
+                        or fingerprints[path] == fingerprint:
+                    continue
+                fingerprints[path] = fingerprint
+            notify(path)
+
+
+class InotifyBackend(WatchBackend):
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+
+    MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+            | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+    # Events that change the items of a directory
+    DIRECTORY_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_CLOSE_WRITE
+
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self, fallback=None):
+        """Watch files through linux inotify
+
+        The parent directory of every file is watched so atomic
+        saves (write then rename) are picked up. A directory shares a
+        single inotify watch between its files and watch_directory.
+        Paths that can not be watched (missing directory, network file
+        system, out of inotify watches) are handed to the fallback
+        backend.
+
+        Args:
+            fallback (WatchBackend): backend for paths inotify can't watch
+        """
+        WatchBackend.__init__(self)
+        self._libc = _load_libc()
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self._fallback = fallback if fallback is not None else PollingBackend()
+        self._directories = {}
+        self._descriptors = {}
+        # Directories watched with watch_directory
+        self._whole_directories = set()
+        self._fallback_paths = set()
+        self._fallback_directories = set()
+        self._thread = threading.Thread(target=self._run,
+                                        name="dotblox-watch-inotify")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _add_watch(self, directory):
+        """Get the inotify watch of the directory, adding it if needed
+
+        Returns:
+            int: watch descriptor, negative when it can't be watched
+        """
+        if directory in self._directories:
+            return self._directories[directory]
+
+        wd = -1
+        if not is_network_path(directory):
+            wd = self._libc.inotify_add_watch(
+                self._fd, _encode(directory), self.MASK)
+        if wd >= 0:
+            self._directories[directory] = wd
+            self._descriptors[wd] = (directory, set())
+        return wd
+
+    def _release_watch(self, directory):
+        """Remove the inotify watch once nothing uses it"""
+        wd = self._directories.get(directory)
+        if wd is None or self._descriptors[wd][1] \
+                or directory in self._whole_directories:
+            return
+        del self._directories[directory]
+        del self._descriptors[wd]
+        self._libc.inotify_rm_watch(self._fd, wd)
+
+    def _add_path(self, path):
+        directory, name = os.path.split(path)
+        wd = self._add_watch(directory)
+        if wd < 0:
+            self._fallback_paths.add(path)
+            self._fallback.watch(path, self._notify)
+            return
+        self._descriptors[wd][1].add(name)
+
+    def _remove_path(self, path):
+        if path in self._fallback_paths:
+            self._fallback_paths.discard(path)
+            self._fallback.unwatch(path, self._notify)
+            return
+
+        directory, name = os.path.split(path)
+        wd = self._directories.get(directory)
+        if wd is None:
+            return
+        self._descriptors[wd][1].discard(name)
+        self._release_watch(directory)
+
+    def _add_directory(self, path):
+        if self._add_watch(path) < 0:
+            self._fallback_directories.add(path)
+            self._fallback.watch_directory(path, self._notify_directory)
+            return
+        self._whole_directories.add(path)
+
+    def _remove_directory(self, path):
+        if path in self._fallback_directories:
+            self._fallback_directories.discard(path)
+            self._fallback.unwatch_directory(path, self._notify_directory)
+            return
+        self._whole_directories.discard(path)
+        self._release_watch(path)
+
+    def _run(self):
+        while True:
+            try:
+                select.select([self._fd], [], [])
+                data = os.read(self._fd, 64 * 1024)
+            except (OSError, select.error) as e:
+                if e.args and e.args[0] in (errno.EINTR, errno.EAGAIN):
+                    continue
+                return
+            paths, directories = self._parse(data)
+            for path in paths:
+                self._notify(path)
+            for path in directories:
+                self._notify_directory(path)
+
+    def _parse(self, data):
+        """Convert raw inotify events into changed file paths
+
+        Args:
+            data (bytes): raw data read from the inotify descriptor
+
+        Returns:
+            tuple: set of watched paths and set of watched directories
+                   that changed
+        """
+        changed = set()
+        changed_directories = set()
+        offset = 0
+        while offset + self._EVENT.size <= len(data):
+            wd, mask, _, length = self._EVENT.unpack_from(data, offset)
+            offset += self._EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+
+            with self._lock:
+                if mask & self.IN_Q_OVERFLOW:
+                    changed.update(os.path.join(d, n)
+                                   for d, names in self._descriptors.values()
+                                   for n in names)
+                    changed_directories.update(self._whole_directories)
+                    continue
+
+                if wd not in self._descriptors:
+                    continue
+
+                directory, names = self._descriptors[wd]
+                if mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF | self.IN_IGNORED):
+                    # The directory is gone, poll until it comes back
+                    paths = [os.path.join(directory, n) for n in names]
+                    changed.update(paths)
+                    del self._descriptors[wd]
+                    del self._directories[directory]
+                    for path in paths:
+                        self._fallback_paths.add(path)
+                        self._fallback.watch(path, self._notify)
+                    if directory in self._whole_directories:
+                        changed_directories.add(directory)
+                        self._whole_directories.discard(directory)
+                        self._fallback_directories.add(directory)
+                        self._fallback.watch_directory(directory, self._notify_directory)
+                    continue
+
+                if mask & self.DIRECTORY_MASK \
+                        and directory in self._whole_directories:
+                    changed_directories.add(directory)
+
+                name = _decode(name)
+                if name in names:
+                    changed.add(os.path.join(directory, name))
+        return changed, changed_directories
+
+
+def _load_libc():
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                       use_errno=True)
+    # Ensure the functions exist
+    libc.inotify_init1, libc.inotify_add_watch, libc.inotify_rm_watch
+    return libc
+
+
+def _encode(path):
+    if isinstance(path, bytes):
+        return path
+    return path.encode(sys.getfilesystemencoding() or "utf-8")
+
+
+def _decode(name):
+    if isinstance(name, str):
+        return name
+    return name.decode(sys.getfilesystemencoding() or "utf-8")
+
+
+__MOUNTS = None
+def _get_mounts():
+    """Get the mount points and their file system types
+
+    Returns:
+        list: (mount point, file system type) longest mount point first
+    """
+    global __MOUNTS
+    if __MOUNTS is None:
+        mounts = []
+        try:
+            with open("/proc/self/mounts") as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) < 3:
+                        continue
+                    mount_point = parts[1].replace("\\040", " ")
+                    mounts.append((mount_point, parts[2]))
+        except (IOError, OSError):
+            pass
+        mounts.sort(key=lambda x: len(x[0]), reverse=True)
+        __MOUNTS = mounts
+    return __MOUNTS
+
+
+def is_network_path(path):
+    """Check if the path lives on a network file system
+
+    Args:
+        path (str): path to check
+
+    Returns:
+        bool
+    """
+    path = os.path.realpath(path)
+    for mount_point, fs_type in _get_mounts():
+        if path == mount_point \
+                or path.startswith(mount_point.rstrip("/") + "/"):
+            return fs_type in NETWORK_FILE_SYSTEMS
+    return False
+
+
+__BACKEND = None
+__BACKEND_LOCK = threading.Lock()
+def get_backend():
+    """Get the shared watch backend for this process
+
+    inotify is used on linux with polling as a fallback.
+
+    Returns:
+        WatchBackend
+    """
+    global __BACKEND
+    with __BACKEND_LOCK:
+        if __BACKEND is None:
+            backend = None
+            if sys.platform.startswith("linux") \
+                    and os.environ.get(BACKEND_ENV) != "poll":
+                try:
+                    backend = InotifyBackend()
+                except (OSError, AttributeError):
+                    backend = None
+            __BACKEND = backend or PollingBackend()
+        return __BACKEND
+
+
+class WatchService(object):
+    def __init__(self, backend=None, delay=DEBOUNCE_DELAY,
+                 max_delay=DEBOUNCE_MAX_DELAY):
+        """Shared, debounced watching of files and directories
+
+        Every path is watched once by the backend no matter how many
+        callbacks follow it. Changes are collected until nothing changed
+        for `delay` seconds, or `max_delay` seconds passed, then every
+        callback is called once with all of its paths that changed. A
+        checkout touching thousands of files arrives as a single batch.
+
+        Callbacks are called from a background thread with a sorted
+        list of paths, use dotblox.qt.mainthread to update widgets.
+
+        Args:
+            backend (WatchBackend): defaults to the shared backend
+            delay (float): seconds without a change before delivering
+            max_delay (float): seconds a change is held back at most
+
+        Usage:
+            service = get_service()
+            service.watch_directory(directory, callback)
+            service.watch(file_path, callback)
+
+        """
+        self.backend = backend if backend is not None else get_backend()
+        self.delay = delay
+        self.max_delay = max_delay
+        self._condition = threading.Condition(threading.RLock())
+        # (is_directory, path): [callbacks]
+        self._callbacks = {}
+        self._pending = set()
+        self._first_change = None
+        self._last_change = None
+        self._thread = None
+
+    def watch(self, path, callback):
+        """Call the callback with a batch of paths when the file changes
+
+        Args:
+            path (str): file path to watch. Does not need to exist
+            callback (func): called with a list of paths that changed
+        """
+        self._watch(False, path, callback)
+
+    def unwatch(self, path, callback):
+        self._unwatch(False, path, callback)
+
+    def watch_directory(self, path, callback):
+        """Call the callback with a batch of paths when items are added
+        to, removed from, renamed or written in the directory, see
+        WatchBackend.watch_directory
+
+        Args:
+            path (str): directory path to watch
+            callback (func): called with a list of directories that changed
+        """
+        self._watch(True, path, callback)
+
+    def unwatch_directory(self, path, callback):
+        self._unwatch(True, path, callback)
+
+    def watch_count(self):
+        """Get the number of paths watched by the service"""
+        with self._condition:
+            return len(self._callbacks)
+
+    def _watch(self, is_directory, path, callback):
+        key = (is_directory, os.path.abspath(path))
+        with self._condition:
+            callbacks = self._callbacks.setdefault(key, [])
+            if callback in callbacks:
+                return
+            callbacks.append(callback)
+            if len(callbacks) > 1:
+                return
+            if is_directory:
+                self.backend.watch_directory(key[1], self._on_directory_changed)
+            else:
+                self.backend.watch(key[1], self._on_file_changed)
+
+    def _unwatch(self, is_directory, path, callback):
+        key = (is_directory, os.path.abspath(path))
+        with self._condition:
+            callbacks = self._callbacks.get(key)
+            if not callbacks or callback not in callbacks:
+                return
+            callbacks.remove(callback)
+            if callbacks:
+                return
+            del self._callbacks[key]
+            if is_directory:
+                self.backend.unwatch_directory(key[1], self._on_directory_changed)
+            else:
+                self.backend.unwatch(key[1], self._on_file_changed)
+
+    def _on_file_changed(self, path):
+        self._add_change((False, path))
+
+    def _on_directory_changed(self, path):
+        self._add_change((True, path))
+
+    def _add_change(self, key):
+        with self._condition:
+            now = time.time()
+            if not self._pending:
+                self._first_change = now
+            self._last_change = now
+            self._pending.add(key)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name="dotblox-watch-service")
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                while True:
+                    remaining = min(self._last_change + self.delay,
+                                    self._first_change + self.max_delay) - time.time()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                pending, self._pending = self._pending, set()
+                batches = {}
+                for key in pending:
+                    for callback in self._callbacks.get(key, []):
+                        batches.setdefault(callback, []).append(key[1])
+            for callback, paths in batches.items():
+                try:
+                    callback(sorted(paths))
+                except Exception:
+                    pass
+
+
+__SERVICE = None
+__SERVICE_LOCK = threading.Lock()
+def get_service():
+    """Get the shared watch service for this process
+
+    Returns:
+        WatchService
+    """
+    global __SERVICE
+    with __SERVICE_LOCK:
+        if __SERVICE is None:
+            __SERVICE = WatchService()
+        return __SERVICE
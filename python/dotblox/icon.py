@@ -1,18 +1,100 @@
+import bisect
 import os
-import glob
+import threading
 
-__ICON_CACHE = {}
-def get_icon(name):
-    """Get icon path of a dotblox icon"""
-    cache = __ICON_CACHE.get(name)
-    if cache:
-        return cache
+# Extra icon directories, separated by os.pathsep. Searched after the
+# dotblox icons in this order
+ICON_PATH_ENVS = ("DOTBLOX_ICON_PATH", "XBMLANGPATH")
+
+ICON_DIRECTORY = os.path.join(__file__.rsplit(os.sep, 3)[0], "icons")
+
+
+def get_icon_directories():
+    """Get the directories searched for icons
+
+    Maya's %B placeholder in XBMLANGPATH is removed.
+
+    Returns:
+        list: existing directories, dotblox icons first
+    """
+    directories = [ICON_DIRECTORY]
+    for env in ICON_PATH_ENVS:
+        for path in os.environ.get(env, "").split(os.pathsep):
+            path = path.replace("%B", "").rstrip("/\\")
+            if path and path not in directories and os.path.isdir(path):
+                directories.append(path)
+    return directories
+
+
+class _Manifest(object):
+    def __init__(self, directories):
+        """Index of the icon files in the directories
+
+        The directories are listed once, every name is then answered
+        from memory, including names that don't exist.
+
+        Args:
+            directories (list): directories to index, earlier wins
+        """
+        self._paths = {}
+        for directory in directories:
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            for name in names:
+                self._paths.setdefault(name, os.path.join(directory, name))
+        self._names = sorted(self._paths)
+        # name: path or None
+        self._lookups = {}
 
-    directory = __file__.rsplit(os.sep, 3)[0]
-    icon_directory = os.path.join(directory, "icons")
+    def find(self, name):
+        """Get the first icon starting with the name
+
+        Args:
+            name (str): file name or the start of it
+
+        Returns:
+            str|None: icon path
+        """
+        try:
+            return self._lookups[name]
+        except KeyError:
+            pass
+        path = self._paths.get(name)
+        if path is None:
+            row = bisect.bisect_left(self._names, name)
+            if row < len(self._names) and self._names[row].startswith(name):
+                path = self._paths[self._names[row]]
+        self._lookups[name] = path
+        return path
+
+
+__MANIFEST = None
+__MANIFEST_LOCK = threading.Lock()
+def _get_manifest():
+    global __MANIFEST
+    with __MANIFEST_LOCK:
+        if __MANIFEST is None:
+            __MANIFEST = _Manifest(get_icon_directories())
+        return __MANIFEST
+
+
+def refresh_icons():
+    """List the icon directories again on the next get_icon, e.g. after
+    adding icons or changing the icon path environment variables"""
+    global __MANIFEST
+    with __MANIFEST_LOCK:
+        __MANIFEST = None
+
+
+def get_icon(name):
+    """Get icon path of a dotblox icon
 
-    files = glob.glob(os.path.join(icon_directory,  "%s*" % name))
-    if files:
-        __ICON_CACHE[name] = files[0]
-        return files[0]
+    Args:
+        name (str): file name or the start of it
 
+    Returns:
+        str|None: icon path
+    """
+    return _get_manifest().find(name)
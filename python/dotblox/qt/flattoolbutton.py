@@ -1,5 +1,7 @@
 from PySide2 import QtCore, QtGui, QtWidgets
 
+from dotblox.qt import iconcache
+
 __author__ = "Ryan Robinson"
 
 
@@ -7,13 +9,15 @@ class FlatToolButton(QtWidgets.QToolButton):
     def __init__(self, icon=None, parent=None):
         """ToolButton to match mayas style
 
+        The hover and disabled icons are drawn from the shared icon cache.
+
         Args:
             icon (str): path of icon to be set
         """
         QtWidgets.QToolButton.__init__(self, parent=parent)
         self.setIconSize(QtCore.QSize(32, 32))
         if not isinstance(icon, QtGui.QIcon):
-            icon = QtGui.QIcon(icon)
+            icon = iconcache.get_cache().icon(icon)
         self.setIcon(icon)
 
     def setIcon(self, icon):
@@ -60,21 +64,7 @@ class FlatToolButton(QtWidgets.QToolButton):
         """
         icon = self.icon()
 
-        if factor == 0:
+        if factor == 0 or icon.isNull():
             return icon
 
-        if icon.isNull():
-            return
-
-        px = icon.pixmap(icon.availableSizes()[-1])
-
-        painter = QtGui.QPainter(px)
-        if factor > 0:
-            color = QtGui.QColor(255, 255, 255, 255 * factor)
-        elif factor < 0:
-            color = QtGui.QColor(0, 0, 0, 255 * abs(factor))
-
-        painter.setCompositionMode(painter.CompositionMode_SourceAtop)
-        painter.fillRect(px.rect(), color)
-        painter.end()
-        return QtGui.QIcon(px)
+        return iconcache.get_cache().icon(icon, tint=factor)
@@ -0,0 +1,312 @@
+import collections
+
+from PySide2 import QtCore, QtGui, QtWidgets
+
+# Bytes of pixmaps kept by the shared cache
+MEMORY_BUDGET = 32 * 1024 * 1024
+# Icons up to this many device pixels are packed into atlas pages
+ATLAS_MAX_SIZE = 64
+# Width and height of an atlas page in pixels
+ATLAS_PAGE_SIZE = 256
+
+
+class _AtlasPage(object):
+    def __init__(self, cell_size):
+        """Pixmap holding a grid of same sized icons
+
+        Args:
+            cell_size (int): width and height of a cell in pixels
+        """
+        self.cell_size = cell_size
+        self.columns = max(1, ATLAS_PAGE_SIZE // cell_size)
+        size = self.columns * cell_size
+        self.pixmap = QtGui.QPixmap(size, size)
+        self.pixmap.fill(QtCore.Qt.transparent)
+        self.cost = size * size * 4
+        self._free = list(reversed(range(self.columns * self.columns)))
+        self.used = 0
+
+    def is_full(self):
+        return not self._free
+
+    def add(self, image):
+        """Draw the image into a free cell
+
+        Args:
+            image (QtGui.QImage): cell sized image
+
+        Returns:
+            tuple: cell number and its QtCore.QRect
+        """
+        cell = self._free.pop()
+        rect = self.cell_rect(cell)
+        painter = QtGui.QPainter(self.pixmap)
+        painter.setCompositionMode(QtGui.QPainter.CompositionMode_Source)
+        painter.drawImage(rect, image)
+        painter.end()
+        self.used += 1
+        return cell, rect
+
+    def remove(self, cell):
+        self._free.append(cell)
+        self.used -= 1
+
+    def cell_rect(self, cell):
+        row, column = divmod(cell, self.columns)
+        return QtCore.QRect(column * self.cell_size, row * self.cell_size,
+                            self.cell_size, self.cell_size)
+
+
+_Entry = collections.namedtuple("_Entry", ["pixmap", "rect", "page", "cell", "cost"])
+
+
+class IconCache(object):
+    def __init__(self, budget=MEMORY_BUDGET):
+        """Least recently used cache of icon pixmaps with a memory budget
+
+        Pixmaps are keyed by source, size, device pixel ratio, tint and
+        whether they are drawn disabled.
+        Small icons are packed into atlas pages so views with thousands
+        of rows draw from a handful of pixmaps. Only use it from the
+        Qt main thread.
+
+        Args:
+            budget (int): bytes of pixmaps to keep
+
+        Usage:
+            cache = get_cache()
+            icon = cache.icon(get_icon("dblx_file.png"))
+            hover_icon = cache.icon(get_icon("dblx_file.png"), tint=.2)
+        """
+        self.budget = budget
+        self._entries = collections.OrderedDict()
+        # cell size: [_AtlasPage]
+        self._pages = {}
+        self._cost = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def memory_used(self):
+        """Get the bytes used by the cached pixmaps and atlas pages"""
+        return self._cost
+
+    def set_budget(self, budget):
+        """Change the memory budget, dropping icons above it
+
+        Args:
+            budget (int): bytes of pixmaps to keep
+        """
+        self.budget = budget
+        self._evict()
+
+    def clear(self):
+        self._entries.clear()
+        self._pages.clear()
+        self._cost = 0
+
+    def icon(self, source, tint=0):
+        """Get an icon that draws from the cache
+
+        Args:
+            source (str|QtGui.QIcon): image path or icon
+            tint (float): 0-1 lightens, -1-0 darkens
+
+        Returns:
+            QtGui.QIcon: null when there is no source
+        """
+        if not source or isinstance(source, QtGui.QIcon) and source.isNull():
+            return QtGui.QIcon()
+        return QtGui.QIcon(_CachedIconEngine(self, source, tint))
+
+    def pixmap(self, source, size, device_pixel_ratio=1.0, tint=0,
+               disabled=False):
+        """Get a pixmap of the icon
+
+        Args:
+            source (str|QtGui.QIcon): image path or icon
+            size (int): width and height in logical pixels
+            device_pixel_ratio (float): ratio of the screen
+            tint (float): 0-1 lightens, -1-0 darkens
+            disabled (bool): greyed out by the style
+
+        Returns:
+            QtGui.QPixmap
+        """
+        pixmap, rect = self.lookup(source, size, device_pixel_ratio, tint,
+                                   disabled)
+        if rect != pixmap.rect():
+            pixmap = pixmap.copy(rect)
+        pixmap.setDevicePixelRatio(device_pixel_ratio)
+        return pixmap
+
+    def lookup(self, source, size, device_pixel_ratio=1.0, tint=0,
+               disabled=False):
+        """Get the pixmap holding the icon and where it is in it
+
+        Args:
+            source (str|QtGui.QIcon): image path or icon
+            size (int): width and height in logical pixels
+            device_pixel_ratio (float): ratio of the screen
+            tint (float): 0-1 lightens, -1-0 darkens
+            disabled (bool): greyed out by the style
+
+        Returns:
+            tuple: QtGui.QPixmap (an atlas page for small icons) and
+                   the QtCore.QRect of the icon
+        """
+        source_key = source
+        if isinstance(source, QtGui.QIcon):
+            source_key = ("icon", source.cacheKey())
+        key = (source_key, size, device_pixel_ratio, tint, disabled)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.pop(key)
+            self._entries[key] = entry
+            return entry.pixmap, entry.rect
+
+        pixels = max(1, int(round(size * device_pixel_ratio)))
+        image = _render(source, pixels, tint)
+        if disabled:
+            image = _disable(image)
+        if pixels <= ATLAS_MAX_SIZE:
+            page = self._get_page(pixels)
+            cell, rect = page.add(image)
+            entry = _Entry(page.pixmap, rect, page, cell, 0)
+        else:
+            pixmap = QtGui.QPixmap.fromImage(image)
+            entry = _Entry(pixmap, pixmap.rect(), None, None, pixels * pixels * 4)
+            self._cost += entry.cost
+        self._entries[key] = entry
+        self._evict(keep=key)
+        return entry.pixmap, entry.rect
+
+    def _get_page(self, cell_size):
+        pages = self._pages.setdefault(cell_size, [])
+        for page in pages:
+            if not page.is_full():
+                return page
+        page = _AtlasPage(cell_size)
+        pages.append(page)
+        self._cost += page.cost
+        return page
+
+    def _evict(self, keep=None):
+        """Drop the least recently used icons until under the budget"""
+        while self._cost > self.budget and self._entries:
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            entry = self._entries.pop(key)
+            self._cost -= entry.cost
+            page = entry.page
+            if page is None:
+                continue
+            page.remove(entry.cell)
+            if not page.used:
+                self._pages[page.cell_size].remove(page)
+                self._cost -= page.cost
+
+
+def _render(source, pixels, tint):
+    """Draw the source centered in a square image
+
+    Args:
+        source (str|QtGui.QIcon): image path or icon
+        pixels (int): width and height
+        tint (float): 0-1 lightens, -1-0 darkens
+
+    Returns:
+        QtGui.QImage
+    """
+    if isinstance(source, QtGui.QIcon):
+        image = source.pixmap(pixels, pixels).toImage()
+    else:
+        image = QtGui.QImage(source)
+
+    result = QtGui.QImage(pixels, pixels, QtGui.QImage.Format_ARGB32_Premultiplied)
+    result.fill(QtCore.Qt.transparent)
+    if image.isNull():
+        return result
+
+    image = image.scaled(pixels, pixels, QtCore.Qt.KeepAspectRatio,
+                         QtCore.Qt.SmoothTransformation)
+    painter = QtGui.QPainter(result)
+    painter.drawImage((pixels - image.width()) // 2,
+                      (pixels - image.height()) // 2, image)
+    if tint:
+        if tint > 0:
+            color = QtGui.QColor(255, 255, 255, int(255 * min(tint, 1)))
+        else:
+            color = QtGui.QColor(0, 0, 0, int(255 * min(-tint, 1)))
+        painter.setCompositionMode(QtGui.QPainter.CompositionMode_SourceAtop)
+        painter.fillRect(result.rect(), color)
+    painter.end()
+    return result
+
+
+def _disable(image):
+    """Grey out the image the way the style draws disabled icons
+
+    Args:
+        image (QtGui.QImage): image to grey out
+
+    Returns:
+        QtGui.QImage
+    """
+    pixmap = QtWidgets.QApplication.style().generatedIconPixmap(
+        QtGui.QIcon.Disabled, QtGui.QPixmap.fromImage(image),
+        QtWidgets.QStyleOption())
+    return pixmap.toImage().convertToFormat(
+        QtGui.QImage.Format_ARGB32_Premultiplied)
+
+
+class _CachedIconEngine(QtGui.QIconEngine):
+    def __init__(self, cache, source, tint=0):
+        """Icon engine drawing from an IconCache
+
+        Args:
+            cache (IconCache): cache to draw from
+            source (str|QtGui.QIcon): image path or icon
+            tint (float): 0-1 lightens, -1-0 darkens
+        """
+        QtGui.QIconEngine.__init__(self)
+        self._cache = cache
+        self._source = source
+        self._tint = tint
+
+    def paint(self, painter, rect, mode, state):
+        size = min(rect.width(), rect.height())
+        if size <= 0:
+            return
+        device = painter.device()
+        ratio = device.devicePixelRatioF() if device is not None else 1.0
+        pixmap, source_rect = self._cache.lookup(
+            self._source, size, ratio, self._tint,
+            disabled=mode == QtGui.QIcon.Disabled)
+        target = QtCore.QRectF(rect.x() + (rect.width() - size) / 2.0,
+                               rect.y() + (rect.height() - size) / 2.0,
+                               size, size)
+        painter.drawPixmap(target, pixmap, QtCore.QRectF(source_rect))
+
+    def pixmap(self, size, mode, state):
+        return self._cache.pixmap(self._source, min(size.width(), size.height()),
+                                  tint=self._tint,
+                                  disabled=mode == QtGui.QIcon.Disabled)
+
+    def clone(self):
+        return _CachedIconEngine(self._cache, self._source, self._tint)
+
+
+__CACHE = None
+def get_cache():
+    """Get the icon cache shared by every dotblox widget
+
+    Returns:
+        IconCache
+    """
+    global __CACHE
+    if __CACHE is None:
+        __CACHE = IconCache()
+    return __CACHE
@@ -0,0 +1,66 @@
+import threading
+
+from PySide2 import QtCore, QtWidgets
+
+
+class _Invoker(QtCore.QObject):
+    invoke = QtCore.Signal(object)
+
+    def __init__(self):
+        """Runs functions emitted from any thread on the thread it lives in"""
+        QtCore.QObject.__init__(self)
+        self.invoke.connect(self._run, QtCore.Qt.QueuedConnection)
+
+    def _run(self, func):
+        func()
+
+
+__INVOKER = None
+__INVOKER_LOCK = threading.Lock()
+def _get_invoker():
+    global __INVOKER
+    with __INVOKER_LOCK:
+        if __INVOKER is None:
+            app = QtWidgets.QApplication.instance()
+            if app is None:
+                raise RuntimeError("A QApplication is needed to call into the main thread")
+            invoker = _Invoker()
+            invoker.moveToThread(app.thread())
+            __INVOKER = invoker
+        return __INVOKER
+
+
+def call_in_main_thread(func, *args, **kwargs):
+    """Call the function on the Qt main thread
+
+    The call is always queued, even from the main thread, it runs the
+    next time the event loop is processed.
+
+    Args:
+        func (func): function to call
+        *args: arguments passed to func
+        **kwargs: keyword arguments passed to func
+    """
+    _get_invoker().invoke.emit(lambda: func(*args, **kwargs))
+
+
+def main_thread_callback(callback):
+    """Wrap a future callback so it runs on the Qt main thread
+
+    Usage:
+        config.io.submit_write(
+            mutator,
+            callback=main_thread_callback(lambda future: widget.refresh()))
+
+    Args:
+        callback (func): called with the future
+
+    Returns:
+        func: callback to give to the future
+    """
+    # Created now, as this is usually called from the main thread
+    _get_invoker()
+
+    def wrap(future):
+        call_in_main_thread(callback, future)
+    return wrap
@@ -0,0 +1,32 @@
+from PySide2 import QtCore, QtWidgets
+from dotblox.icon import get_icon
+from dotblox.qt import standaloneqt
+from dotblox.qt import iconcache
+
+
+def test(app, win, layout):
+    win.setWindowTitle("IconCache Test")
+    win.resize(300, 600)
+    layout.setContentsMargins(0, 0, 0, 0)
+
+    cache = iconcache.get_cache()
+    icons = [cache.icon(get_icon(name)) for name in
+             ("dblx_file_py.png", "dblx_file_mel.png", "dblx_folder.png", "dblx_file.png")]
+
+    list_widget = QtWidgets.QListWidget()
+    for i in range(5000):
+        QtWidgets.QListWidgetItem(icons[i % len(icons)], "item %d" % i, list_widget)
+    layout.addWidget(list_widget)
+
+    label = QtWidgets.QLabel()
+    layout.addWidget(label)
+
+    def update_label():
+        label.setText("%d icons, %.1f KB" % (len(cache), cache.memory_used() / 1024.0))
+    timer = QtCore.QTimer(win)
+    timer.timeout.connect(update_label)
+    timer.start(500)
+
+
+if __name__ == '__main__':
+    standaloneqt.run_as_window(test)
@@ -2,10 +2,12 @@ import math
 import os
 import subprocess
 import traceback
+import weakref
 
 from PySide2 import QtWidgets, QtCore, QtGui
 
-from dotblox import config
+from dotblox import codecache, config, filewatch
+from dotblox.qt import mainthread
 from dotblox.tools.codewall.ui.configdialog import ConfigDialog
 from dotblox.tools.codewall.ui.fileviewwidget import FileViewWidget
 from dotblox.icon import get_icon
@@ -36,47 +38,133 @@ class CodeWallWidget(QtWidgets.QWidget):
 
         self.ui.read_only_menu.setChecked(self.state_config.get_read_only())
 
+        self.configs = []
+        self._watched_configs = set()
+        self._config_listener = self._make_config_listener()
+        self.destroyed.connect(self._make_unwatch_configs())
+        QtWidgets.QApplication.instance().aboutToQuit.connect(self.save_snapshots)
         self._rebuild_tabs()
 
+    def save_snapshots(self):
+        """Save what every loaded tab shows so the next launch can paint it straight away"""
+        for index in range(self.ui.tab_widget.count()):
+            self.ui.tab_widget.widget(index).save_snapshot()
+
+    def closeEvent(self, event):
+        self.save_snapshots()
+        QtWidgets.QWidget.closeEvent(self, event)
+
+    def _make_config_listener(self):
+        """Rebuild the tabs on the main thread when a config changes on disk"""
+        widget_ref = weakref.ref(self)
+
+        def on_changed(paths):
+            widget = widget_ref()
+            if widget is not None:
+                mainthread.call_in_main_thread(widget._rebuild_tabs)
+        return on_changed
+
+    def _make_unwatch_configs(self):
+        watched = self._watched_configs
+        listener = self._config_listener
+
+        def unwatch(*args):
+            service = filewatch.get_service()
+            for path in watched:
+                service.unwatch(path, listener)
+            watched.clear()
+        return unwatch
+
+    def _watch_configs(self):
+        """Follow the config files through the shared watch service"""
+        service = filewatch.get_service()
+        paths = set(x.path for x in self.configs)
+        for path in self._watched_configs - paths:
+            service.unwatch(path, self._config_listener)
+            self._watched_configs.discard(path)
+        for path in paths - self._watched_configs:
+            service.watch(path, self._config_listener)
+            self._watched_configs.add(path)
+
     def _rebuild_tabs(self):
-        """Re update all the configs and rebuild the tabs"""
-        last_tab = self.state_config.get_current_tab()
-        matched_tab = None
+        """Re update all the configs and update the tabs that changed
 
-        self.ui.tab_widget.blockSignals(True)
-        self.ui.tab_widget.clear()
+        Tabs are matched by config and root path. New roots get a tab,
+        removed roots lose theirs and tabs whose label or permissions
+        changed are updated in place, everything else is kept as is.
+        """
+        last_tab = self.state_config.get_current_tab()
+        tab_widget = self.ui.tab_widget
+        tab_bar = tab_widget.tabBar()
 
-        configs = config.find_all("codewall.dblx")
-        self.configs = [Config(x) for x in configs] # python 3 compatible
+        configs = {}
+        for cfg in self.configs:
+            configs[cfg.path] = cfg
+        self.configs = [configs.get(x) or Config(x)
+                        for x in config.find_all("codewall.dblx")]
+        self._watch_configs()
 
         tab_order = self.state_config.get_tab_order()
+        wanted = []
         for cfg in self.configs:
+            roots = cfg.compiled().roots
             for root in sorted(
-                    cfg.get_roots(),
+                    roots,
                     key=lambda x: (tab_order.index(x) if x in tab_order else float("inf"),
-                                   cfg.get_label(x))):
-                tab = FileViewWidget(root, cfg, self.state_config, self.hook)
-                self.ui.tab_widget.addTab(tab, tab.tab_name())
-                if last_tab == root:
-                    matched_tab = tab
-        if matched_tab:
-            self.ui.tab_widget.setCurrentWidget(matched_tab)
-
-        self.ui.tab_widget.blockSignals(False)
+                                   roots[x].label or "")):
+                wanted.append((cfg, roots[root]))
+
+        existing = {}
+        for index in range(tab_widget.count()):
+            widget = tab_widget.widget(index)
+            existing[(widget.config.path, widget.config_path)] = widget
+
+        tab_widget.blockSignals(True)
+
+        wanted_info = dict(((cfg.path, info.path), info) for cfg, info in wanted)
+        for key, widget in list(existing.items()):
+            info = wanted_info.get(key)
+            # A new directory needs a new model
+            if info is None or info.resolved_path != widget.root_info.resolved_path:
+                tab_widget.removeTab(tab_widget.indexOf(widget))
+                widget.deleteLater()
+                del existing[key]
+
+        matched_tab = None
+        for index, (cfg, info) in enumerate(wanted):
+            widget = existing.get((cfg.path, info.path))
+            if widget is None:
+                widget = FileViewWidget(info.path, cfg, self.state_config, self.hook)
+                tab_widget.insertTab(index, widget, widget.tab_name())
+            else:
+                if widget.root_info != info:
+                    widget.update_root_info(info)
+                    tab_widget.setTabText(tab_widget.indexOf(widget), widget.tab_name())
+                current = tab_widget.indexOf(widget)
+                if current != index:
+                    tab_bar.moveTab(current, index)
+            self._update_tab_buttons(index)
+            if last_tab == info.path:
+                matched_tab = widget
+
+        if matched_tab and tab_widget.currentWidget() is not matched_tab:
+            tab_widget.setCurrentWidget(matched_tab)
+
+        tab_widget.blockSignals(False)
         self._update_read_only()
 
-        tab_bar = self.ui.tab_widget.tabBar()
-        for index in range(self.ui.tab_widget.count()):
-            widget = self.ui.tab_widget.widget(index)
-            if widget.can_edit_path:
-                continue
+    def _update_tab_buttons(self, index):
+        """Only show the close button of tabs whose path can be edited
 
-            right = tab_bar.tabButton(index, QtWidgets.QTabBar.RightSide)
-            left = tab_bar.tabButton(index, QtWidgets.QTabBar.LeftSide)
-            if right:
-                right.hide()
-            if left:
-                left.hide()
+        Args:
+            index(int): tab index
+        """
+        widget = self.ui.tab_widget.widget(index)
+        tab_bar = self.ui.tab_widget.tabBar()
+        for side in (QtWidgets.QTabBar.RightSide, QtWidgets.QTabBar.LeftSide):
+            button = tab_bar.tabButton(index, side)
+            if button:
+                button.setVisible(widget.can_edit_path)
 
     def _update_tab_order(self):
         """When the tab order changes update the state config"""
@@ -93,7 +181,7 @@ class CodeWallWidget(QtWidgets.QWidget):
             action = self.ui.config_menu.addAction(
                 config.path,
                 lambda x=config: self._show_config_dialog(config))
-            if config.config_is_locked():
+            if config.compiled().locked:
                 action.setEnabled(False)
                 action.setText("Locked: " + action.text())
 
@@ -155,16 +243,17 @@ class CodeWallWidget(QtWidgets.QWidget):
 
         updates = False
 
-        if label != old_label:
-            updates = True
-            widget.config.update_label(old_path, label)
+        with widget.config.batch():
+            if label != old_label:
+                updates = True
+                widget.config.update_label(old_path, label)
 
-        if relative:
-            path = widget.config.get_relative_path(path)
+            if relative:
+                path = widget.config.get_relative_path(path)
 
-        if path != old_path:
-            updates = True
-            widget.config.update_root(old_path, path)
+            if path != old_path:
+                updates = True
+                widget.config.update_root(old_path, path)
 
         if updates:
             self._rebuild_tabs()
@@ -200,6 +289,7 @@ class CodeWallWidget(QtWidgets.QWidget):
 
         config.remove_root(widget.config_path)
         self.ui.tab_widget.removeTab(index)
+        widget.deleteLater()
 
     def tab_bar_context_menu(self, pos):
         """Menu when right-clicking on tab bar
@@ -276,8 +366,7 @@ class Hook():
 
     def run_file(self, file_path):
         try:
-            with open(file_path) as f:
-                exec (compile(f.read(), file_path, "exec"))
+            exec (codecache.get_code(file_path))
         except Exception as e:
             traceback.print_exc(e)
 
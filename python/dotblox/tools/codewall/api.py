@@ -1,6 +1,9 @@
+import collections
 import datetime
 import os
+import re
 import shutil
+import threading
 from PySide2 import QtWidgets
 from dotblox import config
 from dotblox.tools.codewall.ui.codeeditor import CodeEditor
@@ -8,6 +11,49 @@ from dotblox.tools.codewall.ui.codeeditor import CodeEditor
 DEBUG = False
 ARCHIVE_FOLDER_NAME = "__archive"
 
+# $VAR, ${VAR} and %VAR% (windows)
+_ENV_VAR_PATTERN = re.compile(r"\$(\w+)|\$\{([^}]*)\}|%([^%]*)%")
+# Variables expanduser uses to find the home directory
+_HOME_ENV_VARS = ("HOME", "USERPROFILE", "HOMEDRIVE", "HOMEPATH")
+_RESOLVED_ROOTS_MAX = 1024
+
+__RESOLVED_ROOTS = {}
+__RESOLVED_ROOTS_LOCK = threading.Lock()
+
+
+def resolve_root_path(root, config_dir):
+    """Expand a root path of environment variables, home directory and
+    relative paths without changing the working directory.
+
+    Results are remembered until any of the environment variables the
+    root uses change.
+
+    Args:
+        root (str): root path from a config
+        config_dir (str): absolute directory of the config
+
+    Returns:
+        str: resolved path
+    """
+    env_vars = [a or b or c for a, b, c in _ENV_VAR_PATTERN.findall(root)]
+    if root.startswith("~"):
+        env_vars.extend(_HOME_ENV_VARS)
+    key = (root, config_dir, tuple((x, os.environ.get(x)) for x in env_vars))
+
+    with __RESOLVED_ROOTS_LOCK:
+        path = __RESOLVED_ROOTS.get(key)
+    if path is not None:
+        return path
+
+    path = os.path.expanduser(os.path.expandvars(root))
+    path = os.path.normpath(os.path.join(config_dir, path))
+
+    with __RESOLVED_ROOTS_LOCK:
+        if len(__RESOLVED_ROOTS) >= _RESOLVED_ROOTS_MAX:
+            __RESOLVED_ROOTS.clear()
+        __RESOLVED_ROOTS[key] = path
+    return path
+
 
 def create_new_folder_dialog(path):
     """Dialog for creating a new folder under the given path
@@ -54,9 +100,12 @@ def code_editor(path, parent):
         path: path to file or directory
         parent: file view widget
 
+    Returns:
+        CodeEditor: the editor shown
     """
     win = CodeEditor(parent.hook, path, parent)
     win.show()
+    return win
 
 
 def rename_dialog(path):
@@ -168,6 +217,31 @@ def remove(path, archive_root=None):
     return False
 
 
+class RootInfo(collections.namedtuple(
+        "RootInfo",
+        ["path", "label", "edit_path", "edit_contents", "locked", "config_dir"])):
+    """Settings of a single root path from a config"""
+    __slots__ = ()
+
+    @property
+    def can_edit_path(self):
+        """Whether the path can be edited taking the config lock into account"""
+        return not self.locked and self.edit_path
+
+    @property
+    def can_edit_contents(self):
+        """Whether the contents can be edited taking the config lock into account"""
+        return not self.locked and self.edit_contents
+
+    @property
+    def resolved_path(self):
+        """Absolute path of the root. See resolve_root_path"""
+        return resolve_root_path(self.path, self.config_dir)
+
+
+CompiledConfig = collections.namedtuple("CompiledConfig", ["version", "locked", "roots"])
+
+
 class Config(config.ConfigJSON):
     """Handles the read/write of the config files"""
     PATH_LABEL = "label"
@@ -175,9 +249,52 @@ class Config(config.ConfigJSON):
     PATH_EDIT_CONTENTS = "edit_contents"
     GLOBAL_LOCKED = "__locked__"
 
-    def __init__(self, path):
-        config.ConfigJSON.__init__(self, path)
-        self.roots = {}
+    def __init__(self, path, lock=False):
+        """
+        Args:
+            path (str): path of the codewall.dblx
+            lock (bool): lock the file while saving so users sharing it
+                         don't lose each other's edits. Creates a
+                         codewall.dblx.lock next to it, avoid on network
+                         shares where file locks can hang. See ConfigIO
+        """
+        config.ConfigJSON.__init__(self, path, lock=lock)
+        self._compiled = None
+
+    def compiled(self):
+        """Get every setting of the config in a single typed snapshot
+
+        The snapshot is only rebuilt when the config changes. Within a
+        batch it is built from the uncommitted data and not kept.
+
+        Returns:
+            CompiledConfig: version, locked and roots where roots is an
+                            ordered dict of root path to RootInfo
+        """
+        with self.io as data:
+            in_transaction = self.io.in_transaction()
+            compiled = self._compiled
+            if not in_transaction and compiled is not None \
+                    and compiled.version == self.io.version:
+                return compiled
+
+            locked = data.get(self.GLOBAL_LOCKED, False)
+            config_dir = os.path.dirname(os.path.abspath(self.path))
+            roots = collections.OrderedDict()
+            for path, settings in data.items():
+                if path == self.GLOBAL_LOCKED:
+                    continue
+                roots[path] = RootInfo(
+                    path,
+                    settings.get(self.PATH_LABEL),
+                    settings.get(self.PATH_EDIT_PATH, True),
+                    settings.get(self.PATH_EDIT_CONTENTS, True),
+                    locked,
+                    config_dir)
+            compiled = CompiledConfig(self.io.version, locked, roots)
+            if not in_transaction:
+                self._compiled = compiled
+            return compiled
 
     def get_roots(self):
         """Get all the root paths
@@ -185,13 +302,7 @@ class Config(config.ConfigJSON):
         Returns:
             list: list of all paths
         """
-        result = []
-        with self.io as data:
-            for path in data:
-                if path in [self.GLOBAL_LOCKED]:
-                    continue
-                result.append(path)
-        return result
+        return list(self.compiled().roots)
 
     def expand_path(self, root):
         """Expand the given root path of environment variables,
@@ -203,14 +314,7 @@ class Config(config.ConfigJSON):
         Returns:
             str: resolved path
         """
-        root = os.path.expandvars(root)
-        root = os.path.expanduser(root)
-
-        cwd = os.getcwd()
-        os.chdir(os.path.dirname(self.path))
-        abs_path = os.path.abspath(root)
-        os.chdir(cwd)
-        return abs_path
+        return resolve_root_path(root, os.path.dirname(os.path.abspath(self.path)))
 
     def get_relative_path(self, path):
         """
@@ -238,8 +342,7 @@ class Config(config.ConfigJSON):
         Returns:
             str|None: label or None if not found
         """
-        with self.io as data:
-            return data[root].get(self.PATH_LABEL)
+        return self.compiled().roots[root].label
 
     def root_can_edit_path(self, root):
         """Check where a tab should have
@@ -250,17 +353,14 @@ class Config(config.ConfigJSON):
         Returns:
             bool
         """
-        with self.io as data:
-            return data[root].get(self.PATH_EDIT_PATH, True)
+        return self.compiled().roots[root].edit_path
 
     def root_can_edit_contents(self, root):
-        with self.io as data:
-            return data[root].get(self.PATH_EDIT_CONTENTS, True)
+        return self.compiled().roots[root].edit_contents
 
     def config_is_locked(self):
         """Check if the whole config overrides the editable setting"""
-        with self.io as data:
-            return data.get(self.GLOBAL_LOCKED, False)
+        return self.compiled().locked
 
     def remove_root(self, root):
         """Remove the given root path
@@ -310,21 +410,85 @@ class Config(config.ConfigJSON):
             data[new] = data[old]
             del data[old]
 
+    def validate(self, data):
+        """Ensure the config can still be read by the interface
 
-class StateConfig(config.ConfigJSON):
+        Args:
+            data (dict): data about to be saved
+
+        Raises:
+            ValueError: when the data is invalid
+        """
+        for key, value in data.items():
+            if key == self.GLOBAL_LOCKED:
+                if not isinstance(value, bool):
+                    raise ValueError("%s must be true or false" % key)
+            elif not isinstance(value, dict):
+                raise ValueError("Root %s must contain a dictionary" % key)
+
+
+def _split_item_path(item_path):
+    return [x for x in item_path.replace("\\", "/").split("/") if x]
+
+
+def _walk_states(trie, exists=None):
+    """Walk the expanded states depth first
+
+    Args:
+        trie(dict): nested dictionaries of folder names
+        exists(func|None): called with each relative path, the children
+                           of paths it returns False for are skipped
+
+    Returns:
+        tuple(list, list): existing and missing relative paths,
+                           parents before their children
+    """
+    found = []
+    missing = []
+    stack = [("", trie)]
+    while stack:
+        path, children = stack.pop()
+        if path:
+            if exists is not None and not exists(path):
+                missing.append(path)
+                continue
+            found.append(path)
+        for key in sorted(children, reverse=True):
+            stack.append((path + "/" + key if path else key, children[key]))
+    return found, missing
+
+
+class StateConfig(config.ConfigSQLite):
     """Save the current state of the interface"""
     EXPANDED_STATES = "states"
     CURRENT_TAB = "current_tab"
     READ_ONLY = "read_only"
     TAB_ORDER = "tab_order"
+    SNAPSHOTS = "snapshots"
+    # Expanding/collapsing items writes often, coalesce into a single save
+    WRITE_DELAY = 1.0
 
     def __init__(self, app):
         self.app = app
-        config.ConfigJSON.__init__(self, config.get_global_settings_file("codewall-state.dblx", create=False),
-                                   default={})
+        config.ConfigSQLite.__init__(
+            self,
+            config.get_global_settings_file("codewall-state.db", create=False),
+            default={},
+            write_delay=self.WRITE_DELAY,
+            migrate_from=config.get_global_settings_file("codewall-state.dblx", create=False))
         with self.io.write() as data:
             if self.app not in data:
                 data[self.app] = {self.EXPANDED_STATES: {}}
+            # Expanded states used to be stored as a list of paths
+            link = data[self.app][self.EXPANDED_STATES]
+            for root_path in list(link):
+                if isinstance(link[root_path], list):
+                    trie = {}
+                    for item_path in link[root_path]:
+                        node = trie
+                        for key in _split_item_path(item_path):
+                            node = node.setdefault(key, {})
+                    link[root_path] = trie
 
     def set_read_only(self, value):
         with self.io.write() as data:
@@ -337,20 +501,29 @@ class StateConfig(config.ConfigJSON):
     def set_state(self, root_path, item_path):
         """Set the expanded state
 
+        States are stored as a tree of folder names, every parent
+        of the item is marked as expanded as well.
+
         Args:
             root_path(str): root path from config
             item_path(str): relative path
 
         """
+        keys = _split_item_path(item_path)
+        if not keys:
+            return
         with self.io.write() as data:
             link = data[self.app][self.EXPANDED_STATES]
             if root_path not in link:
-                link[root_path] = [item_path]
-            elif item_path not in link[root_path]:
-                link[root_path].append(item_path)
+                link[root_path] = {}
+            node = link[root_path]
+            for key in keys:
+                if key not in node:
+                    node[key] = {}
+                node = node[key]
 
     def remove_state(self, root_path, item_path):
-        """Remove the expanded state
+        """Remove the expanded state of the item and everything under it
 
         Args:
             root_path(str): root path from config
@@ -358,24 +531,62 @@ class StateConfig(config.ConfigJSON):
 
         """
         with self.io.write() as data:
-            link = data[self.app][self.EXPANDED_STATES]
-            if root_path in link:
-                if item_path in link[root_path]:
-                    link[root_path].remove(item_path)
+            self._remove_state(data[self.app][self.EXPANDED_STATES],
+                               root_path, item_path)
+
+    def _remove_state(self, link, root_path, item_path):
+        keys = _split_item_path(item_path)
+        if not keys or root_path not in link:
+            return
+        node = link[root_path]
+        for key in keys[:-1]:
+            if key not in node:
+                return
+            node = node[key]
+        if keys[-1] in node:
+            del node[keys[-1]]
 
     def get_states(self, root_path):
+        """Get the expanded states
+
+        Args:
+            root_path(str): root path from config
+
+        Returns:
+            list: relative paths, parents before their children
         """
+        with self.io as data:
+            trie = data[self.app][self.EXPANDED_STATES].get(root_path)
+            if not trie:
+                return []
+            return _walk_states(trie)[0]
+
+    def restore_states(self, root_path, exists):
+        """Get the expanded states that still exist
+
+        Folders that no longer exist are removed with everything under
+        them and their children are never checked.
 
         Args:
             root_path(str): root path from config
+            exists(func): called with a relative path, returns whether
+                          the folder still exists
 
         Returns:
-            list: list of files with all states
+            list: relative paths, parents before their children
         """
         with self.io as data:
-            if root_path in data[self.app][self.EXPANDED_STATES]:
-                return data[self.app][self.EXPANDED_STATES][root_path]
-        return []
+            trie = data[self.app][self.EXPANDED_STATES].get(root_path)
+            if not trie:
+                return []
+            found, missing = _walk_states(trie, exists)
+
+        if missing:
+            with self.io.write() as data:
+                link = data[self.app][self.EXPANDED_STATES]
+                for path in missing:
+                    self._remove_state(link, root_path, path)
+        return found
 
     def set_current_tab(self, root_path):
         """Set the current tab
@@ -402,7 +613,7 @@ class StateConfig(config.ConfigJSON):
         Returns:
             list: list of root paths
         """
-        with self.io.write() as data:
+        with self.io as data:
             return data[self.app].get(self.TAB_ORDER, [])
 
     def set_tab_order(self, paths):
@@ -413,3 +624,31 @@ class StateConfig(config.ConfigJSON):
         """
         with self.io.write() as data:
             data[self.app][self.TAB_ORDER] = paths
+
+    def set_snapshot(self, root_path, snapshot):
+        """Set the last painted tree of the root
+
+        Args:
+            root_path(str): root path from config
+            snapshot(dict): json friendly data, None removes it
+        """
+        with self.io.write() as data:
+            link = data[self.app]
+            if self.SNAPSHOTS not in link:
+                link[self.SNAPSHOTS] = {}
+            if snapshot is None:
+                link[self.SNAPSHOTS].pop(root_path, None)
+            else:
+                link[self.SNAPSHOTS][root_path] = snapshot
+
+    def get_snapshot(self, root_path):
+        """Get the last painted tree of the root
+
+        Args:
+            root_path(str): root path from config
+
+        Returns:
+            dict|None: data given to set_snapshot
+        """
+        with self.io as data:
+            return data[self.app].get(self.SNAPSHOTS, {}).get(root_path)
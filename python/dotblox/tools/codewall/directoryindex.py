@@ -0,0 +1,635 @@
+import collections
+import hashlib
+import json
+import os
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from dotblox import config, filewatch
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+# Directories modified this recently are listed again on the next
+# refresh as another change within the same mtime tick would be missed
+_MTIME_RESOLUTION = 2
+# Directories listed at the same time across every index
+POOL_SIZE = 8
+# Seconds changes to the index are held before saving, a burst of
+# changes is saved once
+SAVE_DELAY = 5.0
+
+Entry = collections.namedtuple(
+    "Entry", ["path", "is_dir", "size", "mtime", "ext", "has_matching_children"])
+
+
+__POOL = None
+__POOL_LOCK = threading.Lock()
+def _get_pool():
+    global __POOL
+    with __POOL_LOCK:
+        if __POOL is None:
+            __POOL = ThreadPool(POOL_SIZE)
+        return __POOL
+
+
+def _iter_directory(path):
+    """Get the name, is_dir, size and mtime of every item in the directory"""
+    if scandir is not None:
+        for item in scandir(path):
+            try:
+                is_dir = item.is_dir()
+                stat = item.stat()
+            except OSError:
+                # Broken link or removed while listing
+                continue
+            yield item.name, is_dir, stat.st_size, stat.st_mtime
+        return
+
+    for name in os.listdir(path):
+        try:
+            stat = os.stat(os.path.join(path, name))
+        except OSError:
+            continue
+        yield name, os.path.isdir(os.path.join(path, name)), stat.st_size, stat.st_mtime
+
+
+class _IndexFile(config.ConfigJSON):
+    def __init__(self, path):
+        """Persisted listings of a DirectoryIndex
+
+        Saved without indentation as it can list thousands of directories
+        and is never edited by hand.
+        """
+        config.ConfigJSON.__init__(self, path, write_delay=SAVE_DELAY)
+
+    def _io_write(self, f, data):
+        json.dump(data, f, separators=(",", ":"))
+
+
+class DirectoryIndex(object):
+    def __init__(self, root, extensions, persist=True):
+        """Index of the folders and matching files under a root
+
+        Directories are listed on a thread pool, away from the ui.
+        Only folders and files with one of the extensions are kept.
+        Refreshing only lists the directories whose modified time
+        changed. The index is saved to the global settings folder so
+        the next session can answer straight away.
+
+        Watched directories are followed through the shared
+        filewatch.WatchService and listed again as soon as they change.
+
+        Answers are None while a directory has not been listed yet.
+
+        Args:
+            root (str): directory to index
+            extensions (list): file extensions to keep, including the dot
+            persist (bool): save the index between sessions
+
+        Usage:
+            index = get_index(root, [".py"])
+            index.add_listener(lambda paths: print(paths, "changed"))
+            index.refresh()
+            index.watch(root + "/folder")
+            index.has_children(root + "/folder")
+
+        """
+        self.root = root.replace("\\", "/").rstrip("/") or "/"
+        self.extensions = sorted(set(x.lower() for x in extensions))
+        self.persist = persist
+        self._lock = threading.RLock()
+        # directory path: (mtime, [Entry])
+        self._listings = {}
+        self._listeners = []
+        # directory path: number of watch calls
+        self._watched = {}
+        self._loaded = False
+        self._index_file = None
+        self._thread = None
+        self._queued = None
+        self._requested = set()
+        self._done = threading.Event()
+        self._done.set()
+
+    def _get_file_path(self):
+        key = hashlib.sha1(
+            "|".join([self.root] + self.extensions).encode("utf-8")).hexdigest()
+        return os.path.join(config.get_global_settings_folder(),
+                            "codewall-index", key + ".json")
+
+    def add_listener(self, callback):
+        """Call the callback whenever directories change
+
+        Args:
+            callback (func): called from a background thread with the
+                             list of directory paths that changed
+        """
+        with self._lock:
+            if callback not in self._listeners:
+                self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def watch(self, path):
+        """List the directory again whenever its items change
+
+        Calls are counted, every watch needs an unwatch.
+
+        Args:
+            path (str): directory path
+        """
+        path = self._normalize(path)
+        with self._lock:
+            count = self._watched.get(path, 0)
+            self._watched[path] = count + 1
+            if not count:
+                filewatch.get_service().watch_directory(path, self._on_watched_changed)
+
+    def unwatch(self, path):
+        """Stop following the directory once every watch call is undone
+
+        Args:
+            path (str): directory path
+        """
+        path = self._normalize(path)
+        with self._lock:
+            count = self._watched.get(path)
+            if count is None:
+                return
+            if count > 1:
+                self._watched[path] = count - 1
+                return
+            del self._watched[path]
+            filewatch.get_service().unwatch_directory(path, self._on_watched_changed)
+
+    def _on_watched_changed(self, paths):
+        self.refresh(paths, recursive=False)
+
+    def _notify(self, paths):
+        if not paths:
+            return
+        with self._lock:
+            listeners = list(self._listeners)
+        paths = sorted(paths)
+        for callback in listeners:
+            try:
+                callback(paths)
+            except Exception:
+                pass
+
+    def _normalize(self, path):
+        return path.replace("\\", "/").rstrip("/") or "/"
+
+    def children(self, path):
+        """Get the folders and matching files in the directory
+
+        Args:
+            path (str): directory path
+
+        Returns:
+            list|None: Entry's or None when not listed yet
+        """
+        with self._lock:
+            listing = self._listings.get(self._normalize(path))
+            if listing is None:
+                return None
+            return list(listing[1])
+
+    def has_children(self, path):
+        """Check if the directory has folders or matching files
+
+        Args:
+            path (str): directory path
+
+        Returns:
+            bool|None: None when not listed yet
+        """
+        path = self._normalize(path)
+        with self._lock:
+            listing = self._listings.get(path)
+            if listing is not None:
+                return bool(listing[1])
+            entry = self._get_entry(path)
+        if entry is not None and not entry.is_dir:
+            return False
+        return None
+
+    def get(self, path):
+        """Get the entry of the path
+
+        Args:
+            path (str): file or directory path
+
+        Returns:
+            Entry|None: None when not indexed
+        """
+        with self._lock:
+            return self._get_entry(self._normalize(path))
+
+    def is_dir(self, path):
+        """Check if the path is an indexed directory
+
+        Args:
+            path (str): path to check
+
+        Returns:
+            bool|None: None when the parent was not listed yet
+        """
+        path = self._normalize(path)
+        if path == self.root:
+            return True
+        with self._lock:
+            if os.path.dirname(path) not in self._listings:
+                return None
+            entry = self._get_entry(path)
+        return entry is not None and entry.is_dir
+
+    def _get_entry(self, path):
+        parent = os.path.dirname(path)
+        listing = self._listings.get(parent)
+        if listing is None:
+            return None
+        for entry in listing[1]:
+            if entry.path == path:
+                return entry
+        return None
+
+    def refresh(self, paths=None, recursive=True):
+        """List the directories that changed on a background thread
+
+        Args:
+            paths (list): only check these directories and their
+                          children, defaults to the root
+            recursive (bool): check every known folder under the paths,
+                              otherwise the paths are listed even if
+                              their mtime did not change (a file in
+                              them was written) and only new folders
+                              under them are listed
+        """
+        paths = dict((self._normalize(x), recursive) for x in (paths or [self.root]))
+        with self._lock:
+            if self._thread is not None:
+                # Picked up once the current refresh finishes
+                queued = self._queued or {}
+                for path, value in paths.items():
+                    queued[path] = queued.get(path, False) or value
+                self._queued = queued
+                return
+            self._start(paths)
+
+    def _start(self, paths):
+        self._done.clear()
+        self._thread = threading.Thread(target=self._run, args=(paths,),
+                                        name="dotblox-codewall-index")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def request(self, path):
+        """List a single directory now, ahead of any running refresh
+
+        Args:
+            path (str): directory path
+        """
+        path = self._normalize(path)
+        with self._lock:
+            if path in self._requested:
+                return
+            self._requested.add(path)
+        _get_pool().apply_async(self._list, ((path, None),),
+                                callback=self._on_requested)
+
+    def _on_requested(self, result):
+        path, mtime, _, entries = result
+        with self._lock:
+            self._requested.discard(path)
+            if entries is None:
+                changed = self._remove(path)
+            else:
+                self._set_listing(path, mtime, entries)
+                changed = True
+        if changed:
+            self._notify([path])
+
+    def wait(self, timeout=None):
+        """Wait for the current refresh to finish
+
+        Returns:
+            bool: False if it timed out
+        """
+        return self._done.wait(timeout)
+
+    def _run(self, paths):
+        try:
+            changed = set()
+            if not self._loaded:
+                self._loaded = True
+                changed.update(self._load())
+            self._notify(changed)
+            changed = self._scan(paths)
+            if changed and self.persist:
+                self._save()
+            self._notify(changed)
+        finally:
+            with self._lock:
+                queued, self._queued = self._queued, None
+                self._thread = None
+                if queued:
+                    self._start(queued)
+                else:
+                    self._done.set()
+
+    def _scan(self, paths):
+        """List every directory under the paths whose mtime changed
+
+        Args:
+            paths (dict): directory path and whether to check its known
+                          folders or only the new ones
+
+        Returns:
+            set: directories that changed
+        """
+        changed = set()
+        visited = set()
+        level = sorted(paths.items())
+        while level:
+            with self._lock:
+                known = [(x, self._listings.get(x, (None,))[0] if full else None)
+                         for x, full in level]
+            results = _get_pool().map(self._list, known)
+
+            recursive = dict(level)
+            level = []
+            for path, mtime, identity, entries in results:
+                if identity in visited:
+                    # Symbolic link loop
+                    continue
+                if identity is not None:
+                    visited.add(identity)
+                with self._lock:
+                    if mtime is None and entries is None:
+                        if self._remove(path):
+                            changed.add(path)
+                        continue
+                    if entries is None:
+                        # Unchanged, its children may have changed
+                        entries = self._listings[path][1]
+                    else:
+                        self._set_listing(path, mtime, entries)
+                        changed.add(path)
+                    level.extend((x.path, recursive[path]) for x in entries
+                                 if x.is_dir and (recursive[path]
+                                                  or x.path not in self._listings))
+        return changed
+
+    def _list(self, args):
+        """List a directory unless its mtime matches
+
+        Args:
+            args (tuple): directory path and known mtime
+
+        Returns:
+            tuple: path, mtime, (st_dev, st_ino) and entries. entries is
+                   None when unchanged, mtime and entries are None when
+                   the directory is gone
+        """
+        path, known_mtime = args
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return path, None, None, None
+        identity = (stat.st_dev, stat.st_ino)
+        mtime = stat.st_mtime
+        if time.time() - mtime < _MTIME_RESOLUTION:
+            # Too recent to trust, list it again next time
+            mtime = -1
+        elif known_mtime is not None and mtime == known_mtime:
+            return path, mtime, identity, None
+
+        entries = []
+        try:
+            items = list(_iter_directory(path))
+        except OSError:
+            return path, None, None, None
+        for name, is_dir, size, item_mtime in items:
+            ext = "" if is_dir else os.path.splitext(name)[1].lower()
+            if not is_dir and ext not in self.extensions:
+                continue
+            entries.append(Entry(path.rstrip("/") + "/" + name, is_dir, size,
+                                 item_mtime, ext, False if not is_dir else None))
+        entries.sort(key=lambda x: (not x.is_dir, x.path.lower()))
+        return path, mtime, identity, entries
+
+    def _set_listing(self, path, mtime, entries):
+        old = self._listings.get(path)
+        if old is not None:
+            new_paths = set(x.path for x in entries if x.is_dir)
+            for entry in old[1]:
+                if entry.is_dir and entry.path not in new_paths:
+                    self._remove(entry.path)
+
+        # Fill in what is already known about the children
+        entries = [x._replace(has_matching_children=bool(self._listings[x.path][1]))
+                   if x.is_dir and x.path in self._listings else x
+                   for x in entries]
+        self._listings[path] = (mtime, entries)
+        self._update_parent(path)
+
+    def _update_parent(self, path):
+        """Update has_matching_children of the directory in its parent"""
+        parent = os.path.dirname(path)
+        listing = self._listings.get(parent)
+        if listing is None or parent == path:
+            return
+        has_children = bool(self._listings[path][1])
+        entries = [x._replace(has_matching_children=has_children)
+                   if x.path == path else x
+                   for x in listing[1]]
+        self._listings[parent] = (listing[0], entries)
+
+    def _remove(self, path):
+        """Forget the directory and everything under it
+
+        Returns:
+            bool: whether anything was removed
+        """
+        prefix = path.rstrip("/") + "/"
+        removed = [x for x in self._listings if x == path or x.startswith(prefix)]
+        for key in removed:
+            del self._listings[key]
+        return bool(removed)
+
+    def _load(self):
+        """Load the listings saved by a previous session
+
+        Returns:
+            list: directories loaded
+        """
+        index_file = self._get_index_file()
+        if index_file is None:
+            return []
+        try:
+            with index_file.io as data:
+                directories = data.get("directories", {})
+            return self.seed(directories)
+        except (ValueError, TypeError, OSError, IOError):
+            return []
+
+    def _get_index_file(self):
+        """Get the file the index is saved to, kept open for the whole session
+
+        Returns:
+            _IndexFile|None: None when not persisting
+        """
+        if not self.persist:
+            return None
+        if self._index_file is None:
+            file_path = self._get_file_path()
+            try:
+                if not os.path.exists(os.path.dirname(file_path)):
+                    os.makedirs(os.path.dirname(file_path))
+                try:
+                    self._index_file = _IndexFile(file_path)
+                except ValueError:
+                    # Unreadable, it is listed again and saved over
+                    os.remove(file_path)
+                    self._index_file = _IndexFile(file_path)
+            except (ValueError, OSError, IOError):
+                return None
+        return self._index_file
+
+    def seed(self, directories):
+        """Answer from listings saved by snapshot or a previous session
+
+        Only directories that are not known yet are used, refreshing
+        lists them again if their modified time changed.
+
+        Args:
+            directories (dict): directory path: [mtime, [[name, is_dir, size, mtime]]]
+
+        Returns:
+            list: directories used
+        """
+        listings = {}
+        for path, (mtime, items) in directories.items():
+            listings[path] = (mtime, [
+                Entry(path.rstrip("/") + "/" + name, is_dir, size, item_mtime,
+                      "" if is_dir else os.path.splitext(name)[1].lower(),
+                      False if not is_dir else None)
+                for name, is_dir, size, item_mtime in items])
+
+        with self._lock:
+            seeded = [x for x in listings if x not in self._listings]
+            for path in seeded:
+                self._listings[path] = listings[path]
+            for path in seeded:
+                self._update_parent(path)
+                # Fill in the children seeded before their parent
+                for entry in self._listings[path][1]:
+                    if entry.is_dir and entry.path in self._listings:
+                        self._update_parent(entry.path)
+        return seeded
+
+    def snapshot(self, paths=None):
+        """Get the listings of the directories in a json friendly form
+
+        Args:
+            paths (list): directories to include, defaults to everything
+
+        Returns:
+            dict: directory path: [mtime, [[name, is_dir, size, mtime]]],
+                  see seed
+        """
+        with self._lock:
+            if paths is None:
+                paths = list(self._listings)
+            directories = {}
+            for path in paths:
+                path = self._normalize(path)
+                listing = self._listings.get(path)
+                if listing is None:
+                    continue
+                mtime, entries = listing
+                directories[path] = [mtime, [[x.path.rsplit("/", 1)[1], x.is_dir, x.size, x.mtime]
+                                             for x in entries]]
+        return directories
+
+    def _save(self):
+        """Save the index once the changes settle, see SAVE_DELAY"""
+        index_file = self._get_index_file()
+        if index_file is None:
+            return
+        with index_file.io.write() as data:
+            data["root"] = self.root
+            data["extensions"] = self.extensions
+            data["directories"] = self.snapshot()
+
+
+__PROBES = {}
+__PROBES_LOCK = threading.Lock()
+def probe(path, callback):
+    """Check if the directory exists on a background thread
+
+    An unreachable mount can block for the whole mount timeout so every
+    probe gets its own thread. Probing a path that is already being
+    probed waits on the same answer.
+
+    Args:
+        path (str): directory path
+        callback (func): called from the background thread with the
+                         path and whether it is a directory
+    """
+    with __PROBES_LOCK:
+        callbacks = __PROBES.get(path)
+        if callbacks is not None:
+            callbacks.append(callback)
+            return
+        __PROBES[path] = [callback]
+
+    def run():
+        try:
+            exists = os.path.isdir(path)
+        except Exception:
+            exists = False
+        with __PROBES_LOCK:
+            callbacks = __PROBES.pop(path, [])
+        for func in callbacks:
+            try:
+                func(path, exists)
+            except Exception:
+                pass
+
+    thread = threading.Thread(target=run, name="dotblox-codewall-probe")
+    thread.daemon = True
+    thread.start()
+
+
+__INDEXES = {}
+__INDEXES_LOCK = threading.Lock()
+def get_index(root, extensions):
+    """Get the shared index of the root, it is refreshed the first time
+
+    Args:
+        root (str): directory to index
+        extensions (list): file extensions to keep, including the dot
+
+    Returns:
+        DirectoryIndex
+    """
+    key = (os.path.normcase(os.path.abspath(root)),
+           tuple(sorted(set(x.lower() for x in extensions))))
+    with __INDEXES_LOCK:
+        index = __INDEXES.get(key)
+        if index is None:
+            index = __INDEXES[key] = DirectoryIndex(root, extensions)
+            index.refresh()
+        return index
@@ -0,0 +1,183 @@
+import threading
+import traceback
+from multiprocessing.pool import ThreadPool
+
+from dotblox import codecache
+
+# Compiling holds the GIL, more workers would only slow down the ui
+POOL_SIZE = 1
+EXTENSIONS = (".py",)
+
+
+__POOL = None
+__POOL_LOCK = threading.Lock()
+def _get_pool():
+    global __POOL
+    with __POOL_LOCK:
+        if __POOL is None:
+            __POOL = ThreadPool(POOL_SIZE)
+        return __POOL
+
+
+class Precompiler(object):
+    def __init__(self, directory_index):
+        """Compile the scripts of an index to the code cache ahead of time
+
+        Every script the index knows about is compiled on a background
+        worker, then only those whose size or modified time changed.
+        Scripts that do not compile are remembered with their error.
+
+        Args:
+            directory_index (directoryindex.DirectoryIndex): index of the root
+
+        Usage:
+            precompiler = get_precompiler(index)
+            precompiler.add_listener(lambda paths: print(paths, "changed"))
+            precompiler.get_error(file_path)
+
+        """
+        self.directory_index = directory_index
+        self._lock = threading.RLock()
+        # file path: (size, mtime) compiled
+        self._compiled = {}
+        # file path: error
+        self._errors = {}
+        self._listeners = []
+        directory_index.add_listener(self._on_index_changed)
+        self._submit(None)
+
+    def add_listener(self, callback):
+        """Call the callback whenever the error of a script changes
+
+        Args:
+            callback (func): called from a background thread with the
+                             list of file paths
+        """
+        with self._lock:
+            if callback not in self._listeners:
+                self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def get_error(self, path):
+        """Get why the script does not compile
+
+        Args:
+            path (str): file path
+
+        Returns:
+            str|None: None when it compiled or was not compiled yet
+        """
+        return self._errors.get(path)
+
+    def _on_index_changed(self, paths):
+        self._submit(paths)
+
+    def _submit(self, paths):
+        """Compile the directories on the shared worker
+
+        Args:
+            paths (list): directories, None for everything indexed
+        """
+        _get_pool().apply_async(self._run, (paths,))
+
+    def _run(self, paths):
+        # The pool keeps exceptions in the unused async result, print
+        # them so the errors don't silently stop updating
+        try:
+            self._compile_directories(paths)
+        except Exception:
+            print("Unable to precompile " + self.directory_index.root)
+            traceback.print_exc()
+
+    def _compile_directories(self, paths):
+        """Compile the changed scripts of the directories
+
+        Args:
+            paths (list): directories, None for everything indexed
+        """
+        directories = self.directory_index.snapshot(paths)
+        changed = []
+        if paths is not None:
+            changed.extend(self._forget(paths, directories))
+        for path, (_, items) in directories.items():
+            prefix = path.rstrip("/") + "/"
+            for name, is_dir, size, mtime in items:
+                if is_dir or not name.lower().endswith(EXTENSIONS):
+                    continue
+                file_path = prefix + name
+                with self._lock:
+                    if self._compiled.get(file_path) == (size, mtime):
+                        continue
+                error = codecache.compile_file(file_path)
+                with self._lock:
+                    self._compiled[file_path] = (size, mtime)
+                    if self._errors.get(file_path) != error:
+                        changed.append(file_path)
+                        if error is None:
+                            del self._errors[file_path]
+                        else:
+                            self._errors[file_path] = error
+        self._notify(changed)
+
+    def _forget(self, paths, directories):
+        """Forget the scripts that were removed from the directories
+
+        Args:
+            paths (list): directories that changed
+            directories (dict): their listings, see DirectoryIndex.snapshot
+
+        Returns:
+            list: scripts that had an error
+        """
+        changed = []
+        with self._lock:
+            for path in paths:
+                prefix = path.rstrip("/") + "/"
+                listing = directories.get(path)
+                if listing is None:
+                    # The directory is gone with everything under it
+                    removed = [x for x in self._compiled if x.startswith(prefix)]
+                else:
+                    present = set(prefix + x[0] for x in listing[1])
+                    removed = [x for x in self._compiled
+                               if x.startswith(prefix) and "/" not in x[len(prefix):]
+                               and x not in present]
+                for file_path in removed:
+                    del self._compiled[file_path]
+                    if self._errors.pop(file_path, None) is not None:
+                        changed.append(file_path)
+        return changed
+
+    def _notify(self, paths):
+        if not paths:
+            return
+        with self._lock:
+            listeners = list(self._listeners)
+        paths = sorted(paths)
+        for callback in listeners:
+            try:
+                callback(paths)
+            except Exception:
+                pass
+
+
+__PRECOMPILERS = {}
+__PRECOMPILERS_LOCK = threading.Lock()
+def get_precompiler(directory_index):
+    """Get the shared precompiler of the index, it starts compiling straight away
+
+    Args:
+        directory_index (directoryindex.DirectoryIndex): index of the root
+
+    Returns:
+        Precompiler
+    """
+    with __PRECOMPILERS_LOCK:
+        precompiler = __PRECOMPILERS.get(directory_index)
+        if precompiler is None:
+            precompiler = __PRECOMPILERS[directory_index] = Precompiler(directory_index)
+        return precompiler
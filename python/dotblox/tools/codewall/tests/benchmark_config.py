@@ -0,0 +1,265 @@
+"""Benchmark dotblox.config and the code wall api
+
+Generates synthetic configs in a temporary home directory and prints
+the timings as json so runs can be compared.
+
+Usage:
+    python benchmark_config.py --output before.json
+    python benchmark_config.py --roots 1000 --paths 50000 --repeat 10
+
+Only needs PySide2, the qt platform defaults to offscreen.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from dotblox import config
+from dotblox.tools.codewall import api
+
+
+def _timeit(func, repeat, setup=None):
+    """Time the function
+
+    Args:
+        func (func): function to time
+        repeat (int): number of times to run the function
+        setup (func): called before every run, not timed
+
+    Returns:
+        dict: min, median, mean and max in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    times.sort()
+    return {"min": times[0],
+            "median": times[len(times) // 2],
+            "mean": sum(times) / len(times),
+            "max": times[-1],
+            "repeat": repeat}
+
+
+def _write_json(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f, indent=4)
+
+
+def make_codewall_config(path, roots):
+    """Write a codewall.dblx file
+
+    Args:
+        path (str): file path
+        roots (int): number of roots
+    """
+    data = {api.Config.GLOBAL_LOCKED: False}
+    for i in range(roots):
+        data["$HOME/roots/root_%04d" % i] = {
+            api.Config.PATH_LABEL: "Root %d" % i,
+            api.Config.PATH_EDIT_PATH: i % 2 == 0,
+            api.Config.PATH_EDIT_CONTENTS: i % 3 != 0,
+        }
+    _write_json(path, data)
+    return data
+
+
+def make_state_config(path, apps, roots, paths):
+    """Write a legacy codewall-state.dblx file
+
+    Args:
+        path (str): file path
+        apps (int): number of applications
+        roots (int): number of roots per application
+        paths (int): total number of expanded paths
+
+    Returns:
+        dict: data written
+    """
+    per_root = max(1, paths // (apps * roots))
+    data = {}
+    for a in range(apps):
+        states = {}
+        for r in range(roots):
+            items = []
+            for i in range(per_root):
+                items.append("folder_%d/sub_%d/leaf_%d" % (i % 50, i % 7, i))
+            states["$HOME/roots/root_%04d" % r] = items
+        data["app_%d" % a] = {api.StateConfig.EXPANDED_STATES: states,
+                              api.StateConfig.TAB_ORDER: sorted(states)}
+    _write_json(path, data)
+    return data
+
+
+def make_search_paths(root, count, every):
+    """Create directories to use as sys.path
+
+    Args:
+        root (str): directory to create them in
+        count (int): number of directories
+        every (int): put a codewall.dblx in every nth directory
+
+    Returns:
+        list: directory paths
+    """
+    paths = []
+    # Backdated as directories modified within the last couple of
+    # seconds are always searched again, see config._MTIME_RESOLUTION
+    backdated = time.time() - 10
+    for i in range(count):
+        path = os.path.join(root, "site_%05d" % i)
+        os.makedirs(path)
+        if i % every == 0:
+            _write_json(os.path.join(path, "codewall.dblx"), {})
+        os.utime(path, (backdated, backdated))
+        paths.append(path.replace("\\", "/"))
+    return paths
+
+
+def run(args):
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix="dotblox-benchmark-")
+    home = os.path.join(work_dir, "home")
+    os.makedirs(os.path.join(home, ".dotblox"))
+    # Keep the user's settings out of it
+    environ = dict(os.environ)
+    os.environ["HOME"] = os.environ["USERPROFILE"] = home
+    try:
+        codewall_path = os.path.join(work_dir, "codewall.dblx")
+        make_codewall_config(codewall_path, args.roots)
+        state_path = config.get_global_settings_file("codewall-state.dblx",
+                                                     create=False)
+        make_state_config(state_path, args.apps, args.state_roots, args.paths)
+
+        # ConfigIO
+        def new_io(path):
+            return config.ConfigIO(path, json.load,
+                                   lambda f, d: json.dump(d, f, indent=4),
+                                   watcher=False)
+
+        results["configio_read_cold"] = _timeit(
+            lambda: new_io(state_path).read_from_disk(), args.repeat)
+
+        io = new_io(state_path)
+        io.read_from_disk()
+
+        def read_cached():
+            for _ in range(1000):
+                with io as data:
+                    data.get("app_0")
+        results["configio_read_cached_x1000"] = _timeit(read_cached, args.repeat)
+
+        counter = [0]
+
+        def write():
+            counter[0] += 1
+            with io.write() as data:
+                data["app_0"]["counter"] = counter[0]
+        results["configio_write"] = _timeit(write, args.repeat)
+
+        # StateConfig
+        results["stateconfig_migrate"] = _timeit(
+            lambda: api.StateConfig("app_0").close(),
+            1)
+
+        state = api.StateConfig("app_0")
+        root = "$HOME/roots/root_0000"
+
+        def set_burst():
+            for i in range(args.burst):
+                state.set_state(root, "burst_%d/child_%d" % (i % 20, i))
+            state.flush()
+
+        def remove_burst():
+            for i in range(20):
+                state.remove_state(root, "burst_%d" % i)
+            state.flush()
+
+        results["stateconfig_set_state_burst"] = _timeit(
+            set_burst, args.repeat, setup=remove_burst)
+        results["stateconfig_get_states"] = _timeit(
+            lambda: state.get_states(root), args.repeat)
+        state.close()
+
+        # find_all
+        search_paths = make_search_paths(os.path.join(work_dir, "site"),
+                                         args.sys_path, args.every)
+        sys_path = sys.path[:]
+        sys.path[:] = search_paths
+        try:
+            results["find_all_cold"] = _timeit(
+                lambda: config.find_all("codewall.dblx", refresh=True),
+                args.repeat)
+            results["find_all_warm"] = _timeit(
+                lambda: config.find_all("codewall.dblx"), args.repeat)
+        finally:
+            sys.path[:] = sys_path
+            # The index lives in the temporary home, save it before removing it
+            config._close_discovery_index()
+
+        # Config
+        cfg = api.Config(codewall_path)
+        results["config_get_roots_x100"] = _timeit(
+            lambda: [cfg.get_roots() for _ in range(100)], args.repeat)
+
+        def read_every_root():
+            for root in cfg.get_roots():
+                cfg.get_label(root)
+                cfg.root_can_edit_path(root)
+                cfg.root_can_edit_contents(root)
+        results["config_read_every_root"] = _timeit(read_every_root, args.repeat)
+        cfg.close()
+    finally:
+        os.environ.clear()
+        os.environ.update(environ)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "time": time.time(),
+        "parameters": vars(args),
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--roots", type=int, default=500,
+                        help="roots in the codewall.dblx")
+    parser.add_argument("--apps", type=int, default=4,
+                        help="applications in the state file")
+    parser.add_argument("--state-roots", type=int, default=50,
+                        help="roots per application in the state file")
+    parser.add_argument("--paths", type=int, default=40000,
+                        help="expanded paths in the state file")
+    parser.add_argument("--burst", type=int, default=500,
+                        help="set_state calls per burst")
+    parser.add_argument("--sys-path", type=int, default=2000,
+                        help="directories in the fake sys.path")
+    parser.add_argument("--every", type=int, default=100,
+                        help="put a codewall.dblx in every nth directory")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="times to run each benchmark")
+    parser.add_argument("--output", help="write the json here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    if args.output:
+        _write_json(args.output, report)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        sys.stdout.write("\n")
+
+
+if __name__ == '__main__':
+    main()
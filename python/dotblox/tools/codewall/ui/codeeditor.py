@@ -8,6 +8,8 @@ from dotblox.qt.texteditorwidget import TextEditorWidget
 
 class CodeEditor(QtWidgets.QWidget):
     """Dialog to edit/create script files"""
+    # Path of the file that was saved
+    saved = QtCore.Signal(str)
 
     def __init__(self, hook, path, parent=None):
         QtWidgets.QWidget.__init__(self, parent)
@@ -135,6 +137,7 @@ class CodeEditor(QtWidgets.QWidget):
         self.initial_string = self._sanitize_text(self.ui.editor.get_text())
         with open(path, "w") as f:
             f.write(self.initial_string)
+        self.saved.emit(path)
         return True
 
     def _sanitize_text(self, text):
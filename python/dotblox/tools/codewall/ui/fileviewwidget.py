@@ -1,12 +1,41 @@
+import fnmatch
+import functools
 import os
+import re
+import weakref
 
 from PySide2 import QtWidgets, QtCore, QtGui
+from dotblox.color import materialdesigncolors as mdc
+from dotblox.qt import iconcache, mainthread
 from dotblox.tools.codewall import api
+from dotblox.tools.codewall.directoryindex import get_index, probe
+from dotblox.tools.codewall.precompiler import get_precompiler
 from dotblox.icon import get_icon
 
 
 class FileViewWidget(QtWidgets.QWidget):
-    """Widget for viewing a script directory"""
+    """Widget for viewing a script directory
+
+    The interface is only built the first time the widget is shown and
+    the model is released once it has been hidden for RELEASE_TIMEOUT,
+    so tabs that are never looked at cost next to nothing.
+
+    The root is probed on a background thread, the tab shows
+    "Connecting..." until it answers and "Invalid Path" when it is
+    missing or has not answered within PROBE_TIMEOUT. A root that
+    answers late still becomes live.
+
+    The loaded folders and scroll position are saved with save_snapshot
+    and painted straight away the next time, the directory index then
+    updates whatever changed since.
+    """
+    # Milliseconds a hidden tab keeps its model
+    RELEASE_TIMEOUT = 5 * 60 * 1000
+    # Milliseconds to wait on the root before showing it as invalid
+    PROBE_TIMEOUT = 10 * 1000
+    # Items kept in the snapshot painted on the next launch
+    SNAPSHOT_MAX_ENTRIES = 5000
+
     def __init__(self, root_path, config, state_config, hook, parent=None):
         QtWidgets.QWidget.__init__(self, parent)
         self.hook = hook
@@ -15,52 +44,289 @@ class FileViewWidget(QtWidgets.QWidget):
         self.config = config
         self.config_path = root_path
 
-        is_locked = self.config.config_is_locked()
-
-        self.can_edit_path = not is_locked and self.config.root_can_edit_path(self.config_path)
-        self.can_edit_contents = not is_locked and self.config.root_can_edit_contents(self.config_path)
+        self.root_info = self.config.compiled().roots[self.config_path]
+        self.can_edit_path = self.root_info.can_edit_path
+        self.can_edit_contents = self.root_info.can_edit_contents
+        self.root_path = self.root_info.resolved_path.replace("\\", "/")
+
+        self.ui = None
+        self.directory_index = None
+        self._index_listener = None
+        self.precompiler = None
+        self._precompiler_listener = None
+        self.file_system = None
+        self._read_only = True
+        # Released models miss changes until they are loaded again
+        self._stale = False
+
+        # Expanded states waiting on the directory index
+        self._pending_states = []
+
+        # Name: function undoing what is attached to the model, called
+        # when the widget is destroyed. Holds nothing of the widget
+        self._detach = {}
+        self.destroyed.connect(functools.partial(_detach_all, self._detach))
+
+        self._release_timer = QtCore.QTimer(self)
+        self._release_timer.setSingleShot(True)
+        self._release_timer.setInterval(self.RELEASE_TIMEOUT)
+        self._release_timer.timeout.connect(self.release)
+
+        self._probe_timer = QtCore.QTimer(self)
+        self._probe_timer.setSingleShot(True)
+        self._probe_timer.setInterval(self.PROBE_TIMEOUT)
+        self._probe_timer.timeout.connect(self._on_probe_timeout)
+
+    def update_root_info(self, root_info):
+        """Use the new label and permissions of the root
 
+        Args:
+            root_info (api.RootInfo): settings from the config
+        """
+        self.root_info = root_info
+        self.can_edit_path = root_info.can_edit_path
+        self.can_edit_contents = root_info.can_edit_contents
+        if self.ui is not None:
+            self._update_action_buttons()
+
+    def _update_action_buttons(self):
+        """Only show the create buttons when the contents can be edited"""
+        self.ui.create_folder_btn.setVisible(self.can_edit_contents)
+        self.ui.create_script_btn.setVisible(self.can_edit_contents)
+
+    def is_loaded(self):
+        """Check if the model is loaded"""
+        return self.file_system is not None
+
+    def _build(self):
+        """Build the interface"""
         self.ui = FileViewWidgetUI()
         self.ui.setup_ui(self)
 
-        self.file_system = FileSystemModel()
-        name_filters = list("*" + x for x in self.hook.get_supported_extensions())
-        self.file_system.setNameFilters(name_filters)
-        self.ui.tree_view.setModel(self.file_system)
-
         self.ui.tree_view.customContextMenuRequested.connect(self._tree_view_context_menu)
         self.ui.tree_view.doubleClicked.connect(self._on_tree_view_double_click)
 
         self.ui.create_folder_btn.clicked.connect(lambda *x: self._on_create_folder())
         self.ui.create_script_btn.clicked.connect(lambda *x: self._on_create_script())
+        self._update_action_buttons()
 
         self.ui.tree_view.expanded.connect(self._store_state)
-        self.ui.tree_view.collapsed.connect(self._store_state)
+        self.ui.tree_view.collapsed.connect(self._on_collapsed)
+
+    def load(self):
+        """Build the interface and model if needed and restore the expanded states"""
+        if self.ui is None:
+            self._build()
+        if self.file_system is not None:
+            return
+
+        self.file_system = FileSystemModel()
+        name_filters = list("*" + x for x in self.hook.get_supported_extensions())
+        self.file_system.setNameFilters(name_filters)
+        self.file_system.setReadOnly(self._read_only)
+        self.ui.tree_view.setModel(self.file_system)
 
-        if root_path:
+        if self.config_path:
             self.set_root_path(self.config_path)
-            self._restore_states()
+
+    def release(self):
+        """Release the model of a hidden tab, it is loaded again when shown"""
+        if self.file_system is None or self.isVisible():
+            return
+        self.save_snapshot()
+        if self.directory_index is not None:
+            self.directory_index.remove_listener(self._index_listener)
+            self.directory_index = None
+        if self.precompiler is not None:
+            self.precompiler.remove_listener(self._precompiler_listener)
+            self.precompiler = None
+        self._detach.clear()
+        self._pending_states = []
+        self.ui.tree_view.setModel(None)
+        self.file_system.set_directory_index(None)
+        self.file_system.deleteLater()
+        self.file_system = None
+        self._stale = True
+
+    def showEvent(self, event):
+        """Load on first show, loaded folders follow changes through the watch service"""
+        self._release_timer.stop()
+        if self.file_system is None:
+            self.load()
+        QtWidgets.QWidget.showEvent(self, event)
+
+    def hideEvent(self, event):
+        self._release_timer.start()
+        QtWidgets.QWidget.hideEvent(self, event)
 
     def set_root_path(self, path):
         """Set the root path of the widget
 
+        The view becomes live once the root answered, see PROBE_TIMEOUT.
+
         Args:
             path(str): path to use
 
         """
-        self.root_path = self.config.expand_path(path).replace("\\", "/")
-        layout = self.layout()
+        self.root_path = self.config.compiled().roots[path].resolved_path.replace("\\", "/")
+        self.ui.pages.setCurrentWidget(self.ui.connecting_page)
+        self._probe_timer.start()
+
+        widget_ref = weakref.ref(self)
+
+        def on_probed(root_path, exists):
+            widget = widget_ref()
+            if widget is not None:
+                mainthread.call_in_main_thread(widget._on_probed, root_path, exists)
 
-        layout.removeItem(self.ui.view_layout)
-        layout.removeItem(self.ui.invalid_layout)
+        probe(self.root_path, on_probed)
 
-        if not os.path.exists(self.root_path):
-            layout.addLayout(self.ui.invalid_layout)
+    def _on_probe_timeout(self):
+        if self.ui.pages.currentWidget() is self.ui.connecting_page:
+            self.ui.pages.setCurrentWidget(self.ui.invalid_page)
+
+    def _on_probed(self, root_path, exists):
+        """Show the root once it answered
+
+        Args:
+            root_path (str): path that was probed
+            exists (bool): whether it is a directory
+        """
+        try:
+            if self.file_system is None or root_path != self.root_path \
+                    or self.ui.pages.currentWidget() is self.ui.view_page:
+                # Released, moved or already live
+                return
+        except RuntimeError:
+            # Deleted before the answer was delivered
+            return
+        self._probe_timer.stop()
+        if not exists:
+            self.ui.pages.setCurrentWidget(self.ui.invalid_page)
             return
 
-        layout.addLayout(self.ui.view_layout)
+        self.ui.pages.setCurrentWidget(self.ui.view_page)
+        self._set_directory_index(
+            get_index(self.root_path, self.hook.get_supported_extensions()))
+        snapshot = self.state_config.get_snapshot(self.config_path)
+        if snapshot and snapshot.get("root") == self.root_path:
+            self.directory_index.seed(snapshot.get("directories", {}))
         self.file_system.setRootPath(self.root_path)
         self.ui.tree_view.setRootIndex(self.file_system.index(self.root_path))
+        self.file_system.fetchMore(self.ui.tree_view.rootIndex())
+        if self._stale:
+            self.directory_index.refresh()
+            self._stale = False
+        self._restore_states()
+        if snapshot and snapshot.get("root") == self.root_path:
+            self.ui.tree_view.doItemsLayout()
+            self.ui.tree_view.verticalScrollBar().setValue(snapshot.get("scroll", 0))
+
+    def save_snapshot(self):
+        """Save the loaded folders and scroll position to paint on the next load"""
+        if self.file_system is None or self.directory_index is None:
+            return
+        directories = {}
+        count = 0
+        for path in self.file_system.loaded_paths():
+            listing = self.directory_index.snapshot([path])
+            if not listing:
+                continue
+            count += len(listing[path][1])
+            if count > self.SNAPSHOT_MAX_ENTRIES:
+                break
+            directories.update(listing)
+        self.state_config.set_snapshot(self.config_path, {
+            "root": self.root_path,
+            "scroll": self.ui.tree_view.verticalScrollBar().value(),
+            "directories": directories,
+        })
+
+    def _set_directory_index(self, directory_index):
+        """Answer the model from the index and follow its changes
+
+        Python scripts are compiled in the background to flag the
+        broken ones, see precompiler.Precompiler.
+
+        Args:
+            directory_index (directoryindex.DirectoryIndex): index of the root path
+        """
+        if self.directory_index is not None:
+            self.directory_index.remove_listener(self._index_listener)
+        if self.precompiler is not None:
+            self.precompiler.remove_listener(self._precompiler_listener)
+
+        widget_ref = weakref.ref(self)
+
+        def on_changed(paths):
+            widget = widget_ref()
+            if widget is not None:
+                mainthread.call_in_main_thread(widget._on_index_changed, paths)
+
+        def on_compiled(paths):
+            widget = widget_ref()
+            if widget is not None:
+                mainthread.call_in_main_thread(widget._on_compiled, paths)
+
+        precompiler = None
+        if ".py" in self.hook.get_supported_extensions():
+            precompiler = get_precompiler(directory_index)
+
+        file_system = self.file_system
+
+        def detach():
+            directory_index.remove_listener(on_changed)
+            if precompiler is not None:
+                precompiler.remove_listener(on_compiled)
+            file_system.set_directory_index(None)
+
+        self.directory_index = directory_index
+        self._index_listener = on_changed
+        self.file_system.set_directory_index(directory_index)
+        directory_index.add_listener(on_changed)
+
+        self.precompiler = precompiler
+        self._precompiler_listener = on_compiled
+        self.file_system.set_precompiler(precompiler)
+        if precompiler is not None:
+            precompiler.add_listener(on_compiled)
+        self._detach["directory_index"] = detach
+
+    def _on_compiled(self, paths):
+        """Update the scripts whose compile error changed"""
+        if self.file_system is None:
+            return
+        try:
+            self.file_system.update_paths(paths)
+        except RuntimeError:
+            # Deleted before the change was delivered
+            return
+
+    def _on_index_changed(self, paths):
+        """Update the directories that changed"""
+        if self.file_system is None:
+            return
+        try:
+            self.file_system.refresh_paths(paths)
+            # Expand arrows of folders that are not loaded
+            self.ui.tree_view.doItemsLayout()
+        except RuntimeError:
+            # Deleted before the change was delivered
+            return
+        if self._pending_states:
+            self._expand_states(self._pending_states)
+
+    def _refresh_folder(self, path):
+        """List the folder again after changing it
+
+        Args:
+            path (str): file or folder path
+        """
+        if self.directory_index is None:
+            return
+        if not os.path.isdir(path):
+            path = os.path.dirname(path)
+        self.directory_index.request(path)
 
     def _on_create_folder(self, folder_path=None):
         """Action for creating a folder
@@ -72,11 +338,14 @@ class FileViewWidget(QtWidgets.QWidget):
         if folder_path is None:
             folder_path = self._get_selected_item_folder()
 
-        api.create_new_folder_dialog(folder_path)
+        if api.create_new_folder_dialog(folder_path):
+            self._refresh_folder(folder_path)
 
     def set_read_only(self, value):
         """Enable/Disable drag and drop within the interface"""
-        self.file_system.setReadOnly(value)
+        self._read_only = value
+        if self.file_system is not None:
+            self.file_system.setReadOnly(value)
 
     def _on_create_script(self, folder_path=None):
         """Action for creating a script
@@ -87,7 +356,16 @@ class FileViewWidget(QtWidgets.QWidget):
         """
         if folder_path is None:
             folder_path = self._get_selected_item_folder()
-        api.code_editor(folder_path, self)
+        self._open_code_editor(folder_path)
+
+    def _open_code_editor(self, path):
+        """Open a code editor and list the saved file's folder again
+
+        Args:
+            path(str): file or folder path
+        """
+        editor = api.code_editor(path, self)
+        editor.saved.connect(self._refresh_folder)
 
     def _get_selected_item_folder(self):
         """Get the path of the selected item"""
@@ -143,11 +421,21 @@ class FileViewWidget(QtWidgets.QWidget):
             menu.addSection("Edit")
             if not file_info.isDir():
                 menu.addAction("Modify", lambda *x: self._on_modify_script(file_path))
-            menu.addAction("Rename", lambda *x: api.rename_dialog(file_path))
-            menu.addAction("Delete", lambda *x: api.remove(file_path, archive_root=self.root_path))
+            menu.addAction("Rename", lambda *x: self._on_rename(file_path))
+            menu.addAction("Delete", lambda *x: self._on_remove(file_path))
 
         menu.exec_(QtGui.QCursor.pos())
 
+    def _on_rename(self, file_path):
+        if api.rename_dialog(file_path):
+            self._refresh_folder(os.path.dirname(file_path))
+
+    def _on_remove(self, file_path):
+        if api.remove(file_path, archive_root=self.root_path):
+            self._refresh_folder(os.path.dirname(file_path))
+            self._refresh_folder(os.path.join(self.root_path, api.ARCHIVE_FOLDER_NAME))
+            self._refresh_folder(self.root_path)
+
     def _on_tree_view_double_click(self, index):
         """Run the file on double click
 
@@ -176,10 +464,10 @@ class FileViewWidget(QtWidgets.QWidget):
             file_path(str): file to modify
 
         """
-        api.code_editor(file_path, self)
+        self._open_code_editor(file_path)
 
     def tab_name(self, depth=1):
-        label = self.config.get_label(self.config_path)
+        label = self.root_info.label
         if label:
             return label
 
@@ -193,20 +481,71 @@ class FileViewWidget(QtWidgets.QWidget):
 
         """
 
-        path = self.file_system.fileInfo(index).filePath()
+        path = self.file_system.filePath(index)
         item_path = path.replace(self.root_path, "").lstrip("/")
-        if os.path.isdir(path):
+        if self.file_system.isDir(index):
             if self.ui.tree_view.isExpanded(index):
                 self.state_config.set_state(self.config_path, item_path)
             else:
                 self.state_config.remove_state(self.config_path, item_path)
 
     def _restore_states(self):
-        """Restore the expanded state of the view"""
-        for path in self.state_config.get_states(self.config_path):
+        """Restore the expanded state of the view
+
+        Folders the index has not listed yet are kept without touching
+        the disk, they are expanded once they are listed.
+        """
+        def exists(path):
             path = "{}/{}".format(self.root_path, path)
-            if os.path.exists(path):
-                self.ui.tree_view.setExpanded(self.file_system.index(path), True)
+            is_dir = None
+            if self.directory_index is not None:
+                is_dir = self.directory_index.is_dir(path)
+            if is_dir is None:
+                return True
+            return is_dir
+
+        paths = self.state_config.restore_states(self.config_path, exists)
+        self._expand_states(["{}/{}".format(self.root_path, x) for x in paths])
+
+    def _expand_states(self, paths):
+        """Expand the folders, those not indexed yet are expanded once they are
+
+        Args:
+            paths (list): folder paths, parents before their children
+        """
+        pending = []
+        for path in paths:
+            index = self.file_system.index(path)
+            if index.isValid():
+                self.ui.tree_view.setExpanded(index, True)
+            else:
+                pending.append(path)
+        self._pending_states = pending
+
+    def _on_collapsed(self, index):
+        """Store the state and unload the children of the folder
+
+        Args:
+            index(QtCore.QModelIndex): index from the interface
+
+        """
+        self._store_state(index)
+        self.file_system.unload(index)
+
+
+def _detach_all(detach, *args):
+    """Run the detach functions of a destroyed FileViewWidget
+
+    Args:
+        detach (dict): name: function, see FileViewWidget._detach
+    """
+    for func in list(detach.values()):
+        try:
+            func()
+        except RuntimeError:
+            # The model was already deleted
+            pass
+    detach.clear()
 
 
 class FileViewWidgetUI():
@@ -218,12 +557,12 @@ class FileViewWidgetUI():
         # action_button_layout.setSpacing(2)
 
         self.create_folder_btn = QtWidgets.QPushButton()
-        self.create_folder_btn.setIcon(QtGui.QIcon(get_icon("dblx_folder.png")))
+        self.create_folder_btn.setIcon(iconcache.get_cache().icon(get_icon("dblx_folder.png")))
         self.create_folder_btn.setStyleSheet("background-color: transparent;outline:none;border:none;")
         action_button_layout.addWidget(self.create_folder_btn)
 
         self.create_script_btn = QtWidgets.QPushButton()
-        self.create_script_btn.setIcon(QtGui.QIcon(get_icon("dblx_file.png")))
+        self.create_script_btn.setIcon(iconcache.get_cache().icon(get_icon("dblx_file.png")))
         self.create_script_btn.setStyleSheet("background-color: transparent;outline:none;border:none;")
         action_button_layout.addWidget(self.create_script_btn)
 
@@ -236,55 +575,286 @@ class FileViewWidgetUI():
         label = QtWidgets.QLabel("Invalid Path")
         label.setAlignment(QtCore.Qt.AlignCenter)
         self.invalid_layout.addWidget(label)
+        self.invalid_page = QtWidgets.QWidget()
+        self.invalid_page.setLayout(self.invalid_layout)
+
+        connecting_layout = QtWidgets.QVBoxLayout()
+        label = QtWidgets.QLabel("Connecting...")
+        label.setAlignment(QtCore.Qt.AlignCenter)
+        connecting_layout.addWidget(label)
+        self.connecting_page = QtWidgets.QWidget()
+        self.connecting_page.setLayout(connecting_layout)
 
         self.view_layout = QtWidgets.QVBoxLayout()
         self.view_layout.setContentsMargins(2, 2, 2, 2)
-        if widget.can_edit_contents:
-            self.view_layout.addLayout(action_button_layout)
+        self.view_layout.addLayout(action_button_layout)
         self.view_layout.addWidget(self.tree_view)
+        self.view_page = QtWidgets.QWidget()
+        self.view_page.setLayout(self.view_layout)
 
+        self.pages = QtWidgets.QStackedLayout()
+        self.pages.addWidget(self.connecting_page)
+        self.pages.addWidget(self.view_page)
+        self.pages.addWidget(self.invalid_page)
 
         main_layout = QtWidgets.QVBoxLayout()
-        main_layout.addLayout(self.view_layout)
+        main_layout.addLayout(self.pages)
 
         widget.setLayout(main_layout)
 
 
-class FileSystemModel(QtWidgets.QFileSystemModel):
-    """Reimplemented"""
+class _Node(object):
+    __slots__ = ("name", "path", "is_dir", "ext", "parent", "row",
+                 "children", "entries", "pending")
+
+    def __init__(self, path, is_dir, ext, parent):
+        """Item of the FileSystemModel
+
+        children holds the loaded nodes, always the first rows of
+        entries which is everything the directory index knows about.
+        """
+        self.path = path
+        self.name = path.rsplit("/", 1)[-1]
+        self.is_dir = is_dir
+        self.ext = ext
+        self.parent = parent
+        self.row = 0
+        self.children = []
+        self.entries = None
+        # Waiting on the directory index to list it
+        self.pending = False
+
+
+class FileSystemModel(QtCore.QAbstractItemModel):
+    """File system model answered from a DirectoryIndex
+
+    Children are only loaded when a folder is expanded, BATCH_SIZE rows
+    at a time, and are unloaded when it is collapsed so the memory used
+    depends on what is shown rather than the size of the root. Only
+    loaded folders are watched for changes.
+
+    Scripts that do not compile are shown in ERROR_COLOR with the
+    error as their tooltip.
+    """
+    BATCH_SIZE = 256
+    ERROR_COLOR = mdc.get_color(mdc.Red, mdc.Weight300)
+
     def __init__(self):
-        QtWidgets.QFileSystemModel.__init__(self)
+        QtCore.QAbstractItemModel.__init__(self)
         self.icon_provider = FileIconProvider()
-        self.setIconProvider(self.icon_provider)
-        self.setNameFilterDisables(False)
+        self.directory_index = None
+        self.precompiler = None
+        self._root = None
+        self._read_only = True
+        self._name_filters = []
+        self._name_filter_pattern = None
+        # Loaded folders watched through the directory index
+        self._watched = set()
+
+    def set_directory_index(self, directory_index):
+        """Answer the model from the index
 
-    def supportedDropActions(self):
+        Args:
+            directory_index (directoryindex.DirectoryIndex): index of the root path,
+                None stops watching the loaded folders
+        """
+        self._unwatch_all()
+        self.directory_index = directory_index
 
-        return QtCore.Qt.MoveAction | QtCore.Qt.CopyAction
+    def set_precompiler(self, precompiler):
+        """Flag the scripts that do not compile
 
-    def flags(self, index):
-        """Reimplemeneted
+        Args:
+            precompiler (precompiler.Precompiler): precompiler of the index
+        """
+        self.precompiler = precompiler
+
+    def update_paths(self, paths):
+        """Repaint the loaded items of the paths
 
         Args:
-            index (QtCore.QModelIndex):
+            paths (list): file or folder paths
+        """
+        if self._root is None:
+            return
+        for path in paths:
+            index = self._index_from_loaded_path(path)
+            if index is not None and index.isValid():
+                self.dataChanged.emit(index, index)
+
+    def _watch(self, node):
+        if node.path in self._watched or self.directory_index is None:
+            return
+        self._watched.add(node.path)
+        self.directory_index.watch(node.path)
+
+    def _unwatch(self, node):
+        """Stop watching the folder and every loaded folder under it"""
+        nodes = [node]
+        while nodes:
+            node = nodes.pop()
+            if node.path in self._watched:
+                self._watched.discard(node.path)
+                self.directory_index.unwatch(node.path)
+            nodes.extend(x for x in node.children if x.is_dir)
+
+    def loaded_paths(self):
+        """Get the folders whose children are loaded
 
+        Returns:
+            list: folder paths, parents before their children
         """
+        paths = []
+        nodes = [self._root] if self._root is not None else []
+        for node in nodes:
+            if node.entries is None:
+                continue
+            paths.append(node.path)
+            nodes.extend(x for x in node.children if x.is_dir)
+        return paths
+
+    def _unwatch_all(self):
+        if self.directory_index is not None:
+            for path in self._watched:
+                self.directory_index.unwatch(path)
+        self._watched = set()
+
+    def setRootPath(self, path):
+        """Show the contents of the path
 
-        flags = QtWidgets.QFileSystemModel.flags(self, index)
-        if self.isReadOnly():
-            return flags
+        Args:
+            path (str): directory path
 
-        flags |= QtCore.Qt.ItemIsDropEnabled
+        Returns:
+            QtCore.QModelIndex: index of the path
+        """
+        path = path.replace("\\", "/").rstrip("/") or "/"
+        self.beginResetModel()
+        self._unwatch_all()
+        self._root = _Node(path, True, "", None)
+        self.endResetModel()
+        return self.index(path)
+
+    def rootPath(self):
+        return self._root.path if self._root is not None else ""
+
+    def setReadOnly(self, value):
+        self._read_only = value
+
+    def isReadOnly(self):
+        return self._read_only
+
+    def setNameFilters(self, filters):
+        """Only show files matching the wildcard filters, folders are always shown
 
+        Args:
+            filters (list): wildcards such as *.py
+        """
+        self._name_filters = list(filters)
+        self._name_filter_pattern = None
+        if filters:
+            self._name_filter_pattern = re.compile(
+                "|".join(fnmatch.translate(x) for x in filters), re.IGNORECASE)
+        if self._root is not None:
+            self.setRootPath(self._root.path)
+
+    def nameFilters(self):
+        return list(self._name_filters)
+
+    def setNameFilterDisables(self, value):
+        """Kept for QFileSystemModel compatibility, filtered files are always hidden"""
+        pass
+
+    def _accepts(self, entry):
+        if entry.is_dir or self._name_filter_pattern is None:
+            return True
+        return bool(self._name_filter_pattern.match(entry.path.rsplit("/", 1)[-1]))
+
+    def _node(self, index):
+        if index.isValid():
+            return index.internalPointer()
+        return self._root
+
+    # Path access, matching QFileSystemModel
+
+    def index(self, *args):
+        """Get an index by row, column and parent or by path
+
+        Reimplemented:
+            A path loads every folder leading to it, the index is
+            invalid when a folder was not indexed yet.
+        """
+        if args and not isinstance(args[0], int):
+            return self._index_from_path(args[0])
+
+        row, column = args[:2]
+        parent = args[2] if len(args) > 2 else QtCore.QModelIndex()
+        node = self._node(parent)
+        if node is None or column != 0 or not 0 <= row < len(node.children):
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column, node.children[row])
+
+    def _index_from_path(self, path):
+        if self._root is None:
+            return QtCore.QModelIndex()
+        path = path.replace("\\", "/").rstrip("/") or "/"
+        if path == self._root.path:
+            return QtCore.QModelIndex()
+        if not path.startswith(self._root.path.rstrip("/") + "/"):
+            return QtCore.QModelIndex()
+
+        node = self._root
+        index = QtCore.QModelIndex()
+        for name in path[len(self._root.path):].strip("/").split("/"):
+            self._fetch(node, index, everything=True)
+            for child in node.children:
+                if child.name == name:
+                    node = child
+                    break
+            else:
+                return QtCore.QModelIndex()
+            index = self.createIndex(node.row, 0, node)
+        return index
+
+    def filePath(self, index):
+        node = self._node(index)
+        return node.path if node is not None else ""
+
+    def fileName(self, index):
+        node = self._node(index)
+        return node.name if node is not None else ""
+
+    def fileInfo(self, index):
+        """Get the file info of the index
+
+        Returns:
+            QtCore.QFileInfo: empty for an invalid index
+        """
         if not index.isValid():
-            return flags
+            return QtCore.QFileInfo()
+        return QtCore.QFileInfo(index.internalPointer().path)
 
-        flags |= QtCore.Qt.ItemIsEditable
-        flags |= QtCore.Qt.ItemIsDragEnabled
+    def isDir(self, index):
+        node = self._node(index)
+        return node is not None and node.is_dir
 
-        return flags
+    # QAbstractItemModel
 
-    def columnCount(self, index):
+    def parent(self, index):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+        parent = index.internalPointer().parent
+        if parent is None or parent is self._root:
+            return QtCore.QModelIndex()
+        return self.createIndex(parent.row, 0, parent)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        node = self._node(parent)
+        if node is None:
+            return 0
+        return len(node.children)
+
+    def columnCount(self, index=QtCore.QModelIndex()):
         """
             Set column count to 1
 
@@ -297,22 +867,264 @@ class FileSystemModel(QtWidgets.QFileSystemModel):
         """
         return 1
 
-    def hasChildren(self, index):
+    def hasChildren(self, index=QtCore.QModelIndex()):
         """
         Reimplemented:
             Remove arrow indicator on empty folders
 
+            Answered from the directory index, folders that were not
+            indexed yet keep their arrow until they are.
+
+        Args:
+            index (QtCore.QModelIndex):
+        """
+        node = self._node(index)
+        if node is None or not node.is_dir:
+            return False
+        if node.children:
+            return True
+        if node.entries is not None:
+            return any(self._accepts(x) for x in node.entries)
+        if self.directory_index is not None:
+            has_children = self.directory_index.has_children(node.path)
+            if has_children is not None:
+                return has_children
+        return True
+
+    def canFetchMore(self, index):
+        node = self._node(index)
+        if node is None or not node.is_dir:
+            return False
+        return node.entries is None or len(node.children) < len(node.entries)
+
+    def fetchMore(self, index):
+        node = self._node(index)
+        if node is not None:
+            self._fetch(node, index)
+
+    def _fetch(self, node, index, everything=False):
+        """Load the next batch of children from the directory index
+
+        Args:
+            node (_Node): folder to load
+            index (QtCore.QModelIndex): index of the folder
+            everything (bool): load every child instead of a batch
+        """
+        if node.entries is None:
+            entries = None
+            if self.directory_index is not None:
+                entries = self.directory_index.children(node.path)
+            if entries is None:
+                # Loaded once the index has listed it, see refresh_paths
+                node.pending = True
+                if self.directory_index is not None:
+                    self.directory_index.request(node.path)
+                return
+            node.entries = [x for x in entries if self._accepts(x)]
+            node.pending = False
+            self._watch(node)
+
+        start = len(node.children)
+        end = len(node.entries) if everything \
+            else min(len(node.entries), start + self.BATCH_SIZE)
+        if start >= end:
+            return
+        self.beginInsertRows(index, start, end - 1)
+        for row in range(start, end):
+            entry = node.entries[row]
+            child = _Node(entry.path, entry.is_dir, entry.ext, node)
+            child.row = row
+            node.children.append(child)
+        self.endInsertRows()
+
+    def unload(self, index):
+        """Forget the children of the folder, they are loaded again on expand
+
+        Args:
+            index (QtCore.QModelIndex): folder index
+        """
+        node = self._node(index)
+        if node is None or not node.children:
+            return
+        self.beginRemoveRows(index, 0, len(node.children) - 1)
+        self._unwatch(node)
+        node.children = []
+        node.entries = None
+        self.endRemoveRows()
+
+    def refresh_paths(self, paths):
+        """Update the loaded folders from the directory index
+
+        Args:
+            paths (list): directories that changed
+        """
+        if self._root is None:
+            return
+        for path in paths:
+            index = self._index_from_loaded_path(path)
+            if index is None:
+                continue
+            node = self._node(index)
+            if node.entries is None and not node.pending:
+                # Not loaded, nothing shown to update
+                continue
+            entries = self.directory_index.children(node.path)
+            if entries is None:
+                continue
+            entries = [x for x in entries if self._accepts(x)]
+            if node.entries is None:
+                node.entries = entries
+                node.pending = False
+                self._watch(node)
+                self._fetch(node, index)
+            else:
+                self._merge(node, index, entries)
+
+    def _index_from_loaded_path(self, path):
+        """Get the index of the path without loading anything
+
+        Returns:
+            QtCore.QModelIndex|None: None when not loaded
+        """
+        path = path.replace("\\", "/").rstrip("/") or "/"
+        if path == self._root.path:
+            return QtCore.QModelIndex()
+        if not path.startswith(self._root.path.rstrip("/") + "/"):
+            return None
+        node = self._root
+        for name in path[len(self._root.path):].strip("/").split("/"):
+            for child in node.children:
+                if child.name == name:
+                    node = child
+                    break
+            else:
+                return None
+        return self.createIndex(node.row, 0, node)
+
+    def _merge(self, node, index, entries):
+        """Remove and insert loaded rows to match the new entries"""
+        fully_loaded = len(node.children) == len(node.entries)
+        paths = set(x.path for x in entries)
+        for row in reversed(range(len(node.children))):
+            if node.children[row].path not in paths:
+                self.beginRemoveRows(index, row, row)
+                self._unwatch(node.children[row])
+                del node.children[row]
+                self._renumber(node, row)
+                self.endRemoveRows()
+
+        # Only entries sorted before the last loaded row are inserted,
+        # the rest come in with fetchMore
+        limit = len(entries)
+        if not fully_loaded:
+            limit = 0
+            if node.children:
+                last = node.children[-1].path
+                limit = [x.path for x in entries].index(last) + 1
+
+        loaded = dict((x.path, x) for x in node.children)
+        for row, entry in enumerate(entries[:limit]):
+            child = loaded.get(entry.path)
+            if child is not None:
+                if child.is_dir == entry.is_dir:
+                    continue
+                # Replaced by a folder of the same name or the other way round
+                self.beginRemoveRows(index, child.row, child.row)
+                self._unwatch(child)
+                del node.children[child.row]
+                self._renumber(node, child.row)
+                self.endRemoveRows()
+            self.beginInsertRows(index, row, row)
+            node.children.insert(row, _Node(entry.path, entry.is_dir, entry.ext, node))
+            self._renumber(node, row)
+            self.endInsertRows()
+        node.entries = entries
+
+        if not node.children:
+            self._fetch(node, index)
+
+    def _renumber(self, node, start):
+        for row in range(start, len(node.children)):
+            node.children[row].row = row
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        if role in (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole):
+            return node.name
+        if role == QtCore.Qt.DecorationRole:
+            return self.icon_provider.get_icon(node.is_dir, node.ext)
+        if role in (QtCore.Qt.ToolTipRole, QtCore.Qt.ForegroundRole) \
+                and self.precompiler is not None and not node.is_dir:
+            error = self.precompiler.get_error(node.path)
+            if error is None:
+                return None
+            if role == QtCore.Qt.ToolTipRole:
+                return error
+            return QtGui.QBrush(QtGui.QColor(self.ERROR_COLOR))
+        return None
+
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        """Rename the file or folder
+
+        Returns:
+            bool: renamed
+        """
+        if role != QtCore.Qt.EditRole or not index.isValid() or self._read_only:
+            return False
+        node = index.internalPointer()
+        if not value or value == node.name or "/" in value or "\\" in value:
+            return False
+        new_path = node.parent.path.rstrip("/") + "/" + value
+        if os.path.exists(new_path) or not QtCore.QFile.rename(node.path, new_path):
+            return False
+        self.directory_index.request(node.parent.path)
+        return True
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal:
+            return "Name"
+        return None
+
+    def supportedDropActions(self):
+
+        return QtCore.Qt.MoveAction | QtCore.Qt.CopyAction
+
+    def mimeTypes(self):
+        return ["text/uri-list"]
+
+    def mimeData(self, indexes):
+        data = QtCore.QMimeData()
+        data.setUrls([QtCore.QUrl.fromLocalFile(self.filePath(x))
+                      for x in indexes if x.isValid()])
+        return data
+
+    def flags(self, index):
+        """Reimplemeneted
+
         Args:
             index (QtCore.QModelIndex):
+
         """
-        file_info = self.fileInfo(index)
-        if file_info.exists():
-            if file_info.isDir():
-                files = file_info.absoluteDir().entryList(self.nameFilters(),
-                                      QtCore.QDir.AllDirs |
-                                      QtCore.QDir.NoDotAndDotDot)
-                return bool(files)
-        return False
+
+        flags = QtCore.Qt.NoItemFlags
+        if index.isValid():
+            flags = QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable
+            if not index.internalPointer().is_dir:
+                flags |= QtCore.Qt.ItemNeverHasChildren
+        if self.isReadOnly():
+            return flags
+
+        flags |= QtCore.Qt.ItemIsDropEnabled
+
+        if not index.isValid():
+            return flags
+
+        flags |= QtCore.Qt.ItemIsEditable
+        flags |= QtCore.Qt.ItemIsDragEnabled
+
+        return flags
 
     def dropMimeData(self, data, action, row, column, parent):
         """
@@ -334,14 +1146,14 @@ class FileSystemModel(QtWidgets.QFileSystemModel):
             return False
 
 
-        parent_info = self.fileInfo(parent)  # type: QtCore.QFileInfo
+        node = self._node(parent)
 
-        # filePath does some path resolving so use that to get the path
-        dst_root = self.filePath(parent)
-        if parent_info.isFile():
-            dst_root = parent_info.path()
-        dst_root += QtCore.QDir.separator()
+        dst_root = node.path
+        if not node.is_dir:
+            dst_root = node.parent.path
+        dst_root = dst_root.rstrip("/") + "/"
 
+        changed = set([dst_root])
         for url in data.urls():
             src_path = url.toLocalFile()
             dst_path = dst_root + QtCore.QFileInfo(src_path).fileName()
@@ -349,6 +1161,9 @@ class FileSystemModel(QtWidgets.QFileSystemModel):
                 QtCore.QFile.copy(src_path, dst_path)
             elif action == QtCore.Qt.MoveAction:
                 QtCore.QFile.rename(src_path, dst_path)
+                changed.add(os.path.dirname(src_path))
+        for path in changed:
+            self.directory_index.request(path)
         return True
 
 
@@ -421,30 +1236,45 @@ class _TreeView(QtWidgets.QTreeView):
 
 
 class FileIconProvider(QtWidgets.QFileIconProvider):
-    PIXMAP_CACHE = {}
     def __init__(self):
+        """Icons of the files and folders, drawn from the shared icon cache"""
         QtWidgets.QFileIconProvider.__init__(self)
 
-        self.default_file = self.get_pixmap(get_icon("dblx_file.png"))
-        self.default_folder = self.get_pixmap(get_icon("dblx_folder.png"))
+        cache = iconcache.get_cache()
+        self.default_file = cache.icon(get_icon("dblx_file.png"))
+        self.default_folder = cache.icon(get_icon("dblx_folder.png"))
+        # extension: QtGui.QIcon
+        self._icons = {}
 
     def icon(self, file_info, *args):
 
         if isinstance(file_info, QtCore.QFileInfo):
-
-            if file_info.isFile():
-                icon_path = get_icon("dblx_file_{ext}.png".format(
-                        ext=file_info.suffix()))
-                if icon_path:
-                    if icon_path not in self.PIXMAP_CACHE:
-                        self.PIXMAP_CACHE[icon_path] = self.get_pixmap(icon_path)
-                    return self.PIXMAP_CACHE[icon_path]
-                return self.default_file
-            else:
-                return self.default_folder
+            return self.get_icon(not file_info.isFile(), "." + file_info.suffix())
 
         return QtWidgets.QFileIconProvider.icon(self, file_info)
 
+    def get_icon(self, is_dir, ext):
+        """Get the icon without touching the disk
+
+        Args:
+            is_dir (bool): folder icon
+            ext (str): file extension including the dot
+
+        Returns:
+            QtGui.QIcon
+        """
+        if is_dir:
+            return self.default_folder
+
+        icon = self._icons.get(ext)
+        if icon is None:
+            icon_path = get_icon("dblx_file_{ext}.png".format(ext=ext.lstrip(".")))
+            icon = self.default_file
+            if icon_path:
+                icon = iconcache.get_cache().icon(icon_path)
+            self._icons[ext] = icon
+        return icon
+
     def _is_python_module(self, path):
         return bool(QtCore.QDir(path).entryList(["__init__.*"]))
 
@@ -6,8 +6,8 @@ from dotbloxmaya.core.ui import dockwindow
 from maya import cmds, mel
 
 python_file_command = """
-with open("{file_path}") as f:
-    exec(compile(f.read(), "{file_path}", "exec"), globals(), locals())
+from dotblox import codecache
+exec(codecache.get_code("{file_path}"), globals(), locals())
 """
 
 python_text_command = """